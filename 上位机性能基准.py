@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+上位机性能基准 - 串口取帧、波形解码、画布与光栅渲染
+用法: python 上位机性能基准.py (画布/上屏部分需要显示环境)
+"""
+import importlib.util
+import os
+import time
+import struct
+import binascii
+import numpy as np
+import tkinter as tk
+
+# 上位机文件名不是合法模块名, 按路径加载
+_spec = importlib.util.spec_from_file_location(
+    'oscilloscope', os.path.join(os.path.dirname(os.path.abspath(__file__)), '上位机软件V6.5.py'))
+osc = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(osc)
+
+
+def benchmark_serial_buffer(backlogs=(10, 100, 1000, 4000)):
+    """对比 bytearray 重新切片与 SerialRingBuffer + FrameParser 在不同积压帧数下的单帧取帧开销
+
+    环形缓冲一列走实际的解析器: 旧版 AA 55 裸帧与带 CRC 的 V3 帧各测一次
+    """
+    wave_size = 1200
+    samples = bytes(range(256)) * 4 + bytes(wave_size - 1024)
+    legacy = b'\xAA\x55' + samples
+    body = bytes([osc.V3_VERSION, 0x01, 0, 0]) + struct.pack('<H', wave_size) + samples
+    v3 = osc.V3_HEADER + body + struct.pack('<H', binascii.crc_hqx(body, 0xFFFF))
+    print("积压帧数 | 切片 (μs/帧) | 环形缓冲 旧版 (μs/帧) | 环形缓冲 V3 (μs/帧)")
+    for backlog in backlogs:
+        buf = bytearray(legacy * backlog)
+        t0 = time.perf_counter()
+        count = 0
+        while True:
+            idx = buf.find(b'\xAA\x55')
+            if idx == -1 or len(buf) < idx + 2 + wave_size:
+                break
+            count += len(buf[idx+2:idx+2+wave_size]) == wave_size
+            buf = buf[idx+2+wave_size:]
+        t_slice = (time.perf_counter() - t0) / backlog
+        assert count == backlog
+
+        t_ring = []
+        for frame in (legacy, v3):
+            stream = frame * backlog
+            ring = osc.SerialRingBuffer(len(stream) + 1)
+            ring.write(stream)
+            parser = osc.FrameParser({b'\xAA\x55': (osc.FRAME_WAVE, osc.WAVE_RAW16, wave_size)}, max_payload=wave_size)
+            t0 = time.perf_counter()
+            count = sum(len(payload) == wave_size for _, _, payload in parser.parse(ring))
+            t_ring.append((time.perf_counter() - t0) / backlog)
+            assert count == backlog
+        print(f"{backlog:8d} | {t_slice*1e6:12.2f} | {t_ring[0]*1e6:21.2f} | {t_ring[1]*1e6:19.2f}")
+
+
+def benchmark_waveform_decode(frames=200):
+    """对比逐样本 Python 循环与实际解码函数 (16 位 / 10 位紧凑 / 差分) 的单帧解码耗时"""
+    samples, scale = 200, 5.0 / 1023.0
+    channels = [0, 1, 2]
+    dc_offset = [0.1, 0.2, 0.3]
+    frame = bytes(range(256)) * 4 + bytes(1200 - 1024)
+    current = [[0.0] * samples for _ in range(3)]
+    t0 = time.perf_counter()
+    for _ in range(frames):
+        for i in range(samples):
+            for ch in range(3):
+                idx = (i * 3 + ch) * 2
+                voltage = (frame[idx] + (frame[idx+1] << 8)) * scale
+                current[ch][i] = min(5.0, max(0.0, voltage - dc_offset[ch]))
+    t_loop = (time.perf_counter() - t0) / frames
+
+    out = np.empty((3, samples), dtype=np.float32)
+
+    def timed(decode):
+        t0 = time.perf_counter()
+        for _ in range(frames):
+            osc.samples_to_volts(decode(), samples, channels, scale, dc_offset, out)
+        return (time.perf_counter() - t0) / frames
+
+    t_vec = timed(lambda: np.frombuffer(frame, dtype='<u2', count=3 * samples))
+    packed = bytes(range(250)) * 3
+    t_packed = timed(lambda: osc.unpack_packed10(packed, 3 * samples))
+    # 缓变信号: 类别表全为 0 (4 位差分), 差分 +1/-1 交替
+    delta = bytes(3 * samples // 4) + bytes([0xF1]) * (3 * samples // 2)
+    decoder = osc.DeltaDecoder()
+    t_delta = timed(lambda: decoder.decode(delta, 3 * samples, len(channels)))
+    print(f"波形解码: 循环 {t_loop*1e6:.1f} μs/帧 | 16位 {t_vec*1e6:.1f} μs/帧 | "
+          f"10位紧凑 {t_packed*1e6:.1f} μs/帧 | 差分 {t_delta*1e6:.1f} μs/帧")
+
+
+def benchmark_canvas_render(frames=300, width=1920, height=1080, samples=600):
+    """驱动实际的 update_plot(), 对比两种画布渲染方式的帧率与 CPU 耗时 (需要显示环境)
+
+    全部重建: 每帧清空 plot_layout, 由 build_plot_layer() 删除并重建网格与全部图元 (等同原先的 delete("all"));
+    保留模式: 网格与图元只建一次, 每帧只更新坐标与文字。均为 canvas 后端, 不开余辉与滚动。
+    """
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"画布渲染: 无显示环境, 跳过 ({e})")
+        return
+    root.withdraw()
+    app = osc.UltimateOscilloscopeFinal(root)
+    app.stop_event.set()
+    # 用独立窗口中的 width x height 画布替换主界面画布
+    window = tk.Toplevel(root)
+    window.geometry(f"{width}x{height}+0+0")
+    app.canvas = tk.Canvas(window, width=width, height=height, bg='black', highlightthickness=0)
+    app.canvas.pack(fill=tk.BOTH, expand=True)
+    app.config['render_backend'] = 'canvas'
+    app.config['roll_auto'] = False
+    app.phosphor.mode = 'off'
+    root.update()
+    t = np.linspace(0, 4 * np.pi, samples)
+    waves = [np.stack([2.5 + 1.5 * np.sin(t + ch + k * 0.05) for ch in range(3)]).astype(np.float32)
+             for k in range(frames)]
+
+    results = []
+    for retained in (False, True):
+        app.plot_layout = None
+        t0, c0 = time.perf_counter(), time.process_time()
+        for k in range(frames):
+            app.current_data = waves[k]
+            app.wave_version += 1
+            if not retained:
+                app.plot_layout = None
+            app.update_plot()
+            root.update_idletasks()  # 画布重绘在空闲任务中完成
+        wall, cpu = time.perf_counter() - t0, time.process_time() - c0
+        results.append((frames / wall, cpu / frames * 1e3))
+    size = f"{app.canvas.winfo_width()}x{app.canvas.winfo_height()}"
+    window.destroy()
+    root.destroy()
+    (fps_a, cpu_a), (fps_b, cpu_b) = results
+    print(f"画布渲染 update_plot() canvas 后端 {size}, {samples} 样本/通道: "
+          f"全部重建 {fps_a:.1f} FPS (CPU {cpu_a:.2f} ms/帧) | 保留模式 {fps_b:.1f} FPS (CPU {cpu_b:.2f} ms/帧)")
+
+
+def benchmark_raster_render(frames=100, width=1920, height=1080, samples=600):
+    """光栅后端在 1920x1080 下的单帧耗时: 帧缓冲绘制 (3 波形 + 参考 + 触发线 + 光标) 与 PhotoImage 上屏"""
+    renderer = osc.RasterRenderer()
+    renderer.reset(width, height, (0, 0, 0))
+    for i in range(11):
+        renderer.polyline((i / 10 * width, 0, i / 10 * width, height), (51, 51, 51), target=renderer.background)
+    xs = np.linspace(0, width, samples)
+    t = np.linspace(0, 4 * np.pi, samples)
+    traces = [[np.column_stack((xs, height * (0.5 - 0.15 * np.sin(t + ch + k * 0.05)))).ravel()
+               for ch in range(3)] for k in range(frames)]
+    t0 = time.perf_counter()
+    for k in range(frames):
+        renderer.begin()
+        for ch in range(3):
+            renderer.polyline(traces[k][ch].reshape(-1, 2) * (1, 0.5) + (0, height / 4), (0, 128, 0), dash=(3, 3))
+            renderer.polyline(traces[k][ch], (0, 255, 255), width=2)
+        renderer.polyline((0, height / 2, width, height / 2), (255, 0, 0), dash=(4, 4))
+        renderer.polyline((width / 3, 0, width / 3, height), (255, 255, 255), dash=(2, 2))
+        ppm = renderer.to_ppm()
+    t_draw = (time.perf_counter() - t0) / frames
+    line = f"光栅渲染 {width}x{height}: 帧缓冲 {t_draw*1e3:.2f} ms/帧"
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        print(line + " | 上屏: 无显示环境, 跳过")
+        return
+    photo = tk.PhotoImage(width=width, height=height)
+    canvas = tk.Canvas(root, width=width, height=height, highlightthickness=0)
+    canvas.pack()
+    canvas.create_image(0, 0, image=photo, anchor='nw')
+    root.update()
+    t0 = time.perf_counter()
+    for _ in range(frames):
+        photo.configure(data=ppm, format='PPM')
+        root.update_idletasks()
+    t_blit = (time.perf_counter() - t0) / frames
+    root.destroy()
+    print(line + f" | 上屏 {t_blit*1e3:.2f} ms/帧 | 合计约 {1.0 / (t_draw + t_blit):.0f} FPS")
+
+
+if __name__ == "__main__":
+    benchmark_serial_buffer()
+    benchmark_waveform_decode()
+    benchmark_canvas_render()
+    benchmark_raster_render()
@@ -16,10 +16,1071 @@ import serial
 import serial.tools.list_ports
 import math
 import threading
+import collections
+import numpy as np
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import json
 import os
+import binascii
+import struct
+
+
+# ========== 串口环形缓冲区 ==========
+class SerialRingBuffer:
+    """固定容量、预分配的字节环形缓冲区
+
+    串口线程用 readinto 直接写入, 解析器通过 memoryview 取帧,
+    消费帧只移动读游标, 不再复制剩余数据。
+    """
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        # 跨越回绕点的帧拼接到这里 (同一时刻只有一个有效)
+        self._scratch = bytearray(capacity)
+        self._scratch_view = memoryview(self._scratch)
+        self._head = 0      # 读游标 (累计字节)
+        self._tail = 0      # 写游标 (累计字节)
+        self.overruns = 0   # 缓冲区满时丢弃旧数据的次数
+        self.dropped_bytes = 0
+
+    def __len__(self):
+        return self._tail - self._head
+
+    def free_space(self):
+        return self.capacity - (self._tail - self._head)
+
+    def _write_region(self):
+        start = self._tail % self.capacity
+        free = self.free_space()
+        return self._view[start:start + min(free, self.capacity - start)]
+
+    def _make_room(self):
+        if self.free_space() == 0:
+            self.consume(self.capacity // 2)
+            self.overruns += 1
+            self.dropped_bytes += self.capacity // 2
+
+    def readinto_from(self, port, max_bytes):
+        """从串口直接读入缓冲区, 返回实际读取字节数"""
+        total = 0
+        while total < max_bytes:
+            self._make_room()
+            region = self._write_region()[:max_bytes - total]
+            n = port.readinto(region) or 0
+            self._tail += n
+            total += n
+            if n < len(region):
+                break
+        return total
+
+    def write(self, data):
+        data = memoryview(data)
+        pos = 0
+        while pos < len(data):
+            self._make_room()
+            region = self._write_region()
+            n = min(len(region), len(data) - pos)
+            region[:n] = data[pos:pos + n]
+            self._tail += n
+            pos += n
+
+    def byte_at(self, offset):
+        return self._buf[(self._head + offset) % self.capacity]
+
+    def find(self, pattern, offset=0):
+        """查找 pattern, 返回相对读游标的偏移, 未找到返回 -1"""
+        size = len(self)
+        plen = len(pattern)
+        if size - offset < plen:
+            return -1
+        cap = self.capacity
+        start = (self._head + offset) % cap
+        end = start + (size - offset)
+        if end <= cap:
+            idx = self._buf.find(pattern, start, end)
+            return -1 if idx < 0 else idx - start + offset
+        # 数据跨越回绕点: 尾段 -> 跨界 -> 头段
+        idx = self._buf.find(pattern, start, cap)
+        if idx >= 0:
+            return idx - start + offset
+        first = cap - start
+        for k in range(plen - 1, 0, -1):
+            pos = offset + first - k
+            if pos >= offset and pos + plen <= size and \
+                    all(self.byte_at(pos + j) == pattern[j] for j in range(plen)):
+                return pos
+        idx = self._buf.find(pattern, 0, end - cap)
+        return -1 if idx < 0 else idx + first + offset
+
+    def peek(self, offset, size):
+        """返回 [offset, offset+size) 的只读视图, 在 consume 之前有效"""
+        cap = self.capacity
+        start = (self._head + offset) % cap
+        if start + size <= cap:
+            return self._view[start:start + size]
+        first = cap - start
+        self._scratch_view[:first] = self._view[start:]
+        self._scratch_view[first:size] = self._view[:size - first]
+        return self._scratch_view[:size]
+
+    def consume(self, n):
+        self._head += min(n, len(self))
+
+    def clear(self):
+        self._head = self._tail = 0
+
+
+# ========== 流式帧解析器 ==========
+FRAME_WAVE = 'wave'
+FRAME_CTRL = 'ctrl'
+FRAME_INFO = 'info'
+
+# V3 帧格式: 5A A5 | 版本 | 类型 | 序号(u16) | 长度(u16) | 负载 | CRC16
+# CRC 为 CRC-16/CCITT-FALSE, 覆盖 版本..负载
+# V3 波形负载以 首样本 micros(u32) | 末样本 micros(u32) | 触发行(u16) | 触发相位(u16) | 首样本行序号(u32) 开头
+# 电平穿越位于第 触发行-1 与 触发行 个样本之间的 相位/65536 处; 触发行 0xFFFF 表示未触发
+# 行序号仅流模式有效 (每通道样本的累计序号, 32 位回绕), 其他模式为 0xFFFFFFFF
+V3_HEADER = b'\x5A\xA5'
+V3_VERSION = 3
+V3_META_SIZE = 6
+V3_WAVE_STAMP_SIZE = 16
+V3_TRIG_ROW_NONE = 0xFFFF
+V3_STREAM_ROW_NONE = 0xFFFFFFFF
+V3_INFO_FLAG_STREAM = 0x01  # 配置帧标志: 设备处于无间隙流模式
+
+# 波形负载编码
+WAVE_RAW16 = 'raw16'        # 每样本 2 字节小端
+WAVE_PACKED10 = 'packed10'  # 4 样本 / 5 字节: 4 个低 8 位 + 1 字节高 2 位
+WAVE_DELTA = 'delta'        # 同通道差分: 2 位类别表 + 4/8/16 位差分流
+V3_TYPES = {
+    0x01: (FRAME_WAVE, WAVE_RAW16),
+    0x02: (FRAME_CTRL, None),
+    0x03: (FRAME_WAVE, WAVE_PACKED10),
+    0x04: (FRAME_WAVE, WAVE_DELTA),
+    0x05: (FRAME_INFO, None),   # 每通道样本数(u16) | 通道掩码(u8) [| ADC模式(u8) | 每通道采样率(u32) [| 标志(u8) [| 采集溢出(u16)]]]
+}
+
+
+def unpack_packed10(data, count):
+    """向量化解包 10 位紧凑编码, 返回 count 个 uint16 样本"""
+    groups = np.frombuffer(data, dtype=np.uint8, count=count // 4 * 5).reshape(-1, 5)
+    high = (groups[:, 4:5] >> np.array([0, 2, 4, 6], dtype=np.uint8)) & 0x03
+    return (groups[:, :4].astype(np.uint16) | (high.astype(np.uint16) << 8)).reshape(-1)
+
+
+def samples_to_volts(raw, samples_per_chan, channels, scale, dc_offset, out=None):
+    """交织 ADC 计数 -> (3, 样本) float32 电压: 转置后写入启用通道的行, 再缩放/去偏移/限幅
+
+    给出 out 时原地写入并返回 out, 否则新分配
+    """
+    if out is None:
+        out = np.zeros((3, samples_per_chan), dtype=np.float32)
+    else:
+        out.fill(0.0)
+    out[channels] = raw.reshape(samples_per_chan, len(channels)).T
+    out *= scale
+    out -= np.asarray(dc_offset, dtype=np.float32)[:, None]
+    np.clip(out, 0.0, 5.0, out=out)
+    return out
+
+
+class DeltaDecoder:
+    """差分编码的流式解码器
+
+    随解析器逐帧调用, 直接从环形缓冲区的 memoryview 解码; 类别表查找表与差分工作缓冲区
+    跨帧复用, 每帧只做查表、分流与按通道 cumsum 三步向量运算, 不产生逐样本的 Python 循环。
+    """
+    def __init__(self):
+        # 类别表每字节 4 个样本 (低位在前), 256 项查找表一次展开
+        self._classes = (np.arange(256, dtype=np.uint8)[:, None] >> np.array([0, 2, 4, 6], dtype=np.uint8)) & 0x03
+        self._deltas = np.empty(0, dtype=np.int32)
+
+    def decode(self, data, count, channels=3):
+        """解码一帧负载, 返回 count 个交织样本"""
+        buf = np.frombuffer(data, dtype=np.uint8)
+        map_size = count // 4
+        classes = self._classes[buf[:map_size]].reshape(-1)
+        is4, is8 = classes == 0, classes == 1
+        n4, n8 = int(np.count_nonzero(is4)), int(np.count_nonzero(is8))
+        n16 = count - n4 - n8
+        pos = map_size
+        nib_bytes = buf[pos:pos + (n4 + 1) // 2]
+        pos += len(nib_bytes)
+        nibbles = np.empty(len(nib_bytes) * 2, dtype=np.int32)
+        nibbles[0::2] = nib_bytes & 0x0F
+        nibbles[1::2] = nib_bytes >> 4
+        if len(self._deltas) != count:
+            self._deltas = np.empty(count, dtype=np.int32)
+        deltas = self._deltas
+        deltas[is4] = (nibbles[:n4] ^ 8) - 8
+        deltas[is8] = buf[pos:pos + n8].view(np.int8)
+        pos += n8
+        deltas[classes == 2] = np.frombuffer(data, dtype='<i2', count=n16, offset=pos)
+        return np.cumsum(deltas.reshape(-1, channels), axis=0).reshape(-1)
+
+
+class FrameParser:
+    """单次遍历的增量状态机解析器
+
+    同步状态下只检查期望位置的两字节帧头, 不做搜索; 帧头不符时才进入
+    HUNT 状态重新同步。不完整的帧留在环形缓冲区中等待下次调用。
+    同时识别 V3 帧与旧版 (V2.0/V2.3) 裸帧头, 收到首个有效 V3 帧后
+    不再接受旧版帧头。
+    """
+    def __init__(self, frame_types, max_payload=4096):
+        # frame_types: 旧版 {帧头 bytes: (类型, 编码, 负载长度)}
+        self.frame_types = {(h[0], h[1]): ftype for h, ftype in frame_types.items()}
+        self.headers = [V3_HEADER] + list(frame_types)
+        self.max_payload = max_payload
+        self.reset()
+        self._ring_overruns = 0
+        self.resyncs = 0
+        self.skipped_bytes = 0
+        self.frames_received = 0
+        self.crc_failures = 0
+        self.seq_gaps = 0
+
+    def reset(self):
+        self.state = 'HUNT'
+        self.version = None
+        self.last_seq = None
+
+    def parse(self, ring):
+        """按到达顺序产出 (类型, 编码, memoryview); 负载仅在迭代到下一帧前有效"""
+        if ring.overruns != self._ring_overruns:
+            # 缓冲区溢出丢弃了半个缓冲区, 读游标可能落在帧中间: 重新寻找帧头
+            self._ring_overruns = ring.overruns
+            self.state = 'HUNT'
+        while len(ring) >= 2:
+            hdr = (ring.byte_at(0), ring.byte_at(1))
+            if hdr == (V3_HEADER[0], V3_HEADER[1]):
+                if len(ring) < 2 + V3_META_SIZE:
+                    return
+                ftype = V3_TYPES.get(ring.byte_at(3))
+                length = ring.byte_at(6) | (ring.byte_at(7) << 8)
+                if ring.byte_at(2) != V3_VERSION or ftype is None or length > self.max_payload:
+                    if not self._resync(ring):
+                        return
+                    continue
+                total = 2 + V3_META_SIZE + length + 2
+                if len(ring) < total:
+                    return
+                crc = ring.byte_at(total - 2) | (ring.byte_at(total - 1) << 8)
+                if binascii.crc_hqx(ring.peek(2, V3_META_SIZE + length), 0xFFFF) != crc:
+                    self.crc_failures += 1
+                    if not self._resync(ring):
+                        return
+                    continue
+                self._track_seq(ring.byte_at(4) | (ring.byte_at(5) << 8))
+                self.version = V3_VERSION
+                self.state = 'SYNC'
+                self.frames_received += 1
+                yield ftype[0], ftype[1], ring.peek(2 + V3_META_SIZE, length)
+                ring.consume(total)
+                continue
+            ftype = self.frame_types.get(hdr) if self.version != V3_VERSION else None
+            if ftype is None:
+                if not self._resync(ring):
+                    return
+                continue
+            kind, encoding, size = ftype
+            if len(ring) < 2 + size:
+                return
+            self.version = 2
+            self.state = 'SYNC'
+            self.frames_received += 1
+            yield kind, encoding, ring.peek(2, size)
+            ring.consume(2 + size)
+
+    def _resync(self, ring):
+        """丢弃当前位置, 跳到下一个候选帧头; 没有候选时返回 False"""
+        if self.state == 'SYNC':
+            self.resyncs += 1
+        self.state = 'HUNT'
+        headers = [V3_HEADER] if self.version == V3_VERSION else self.headers
+        found = [i for i in (ring.find(h, 1) for h in headers) if i >= 0]
+        skip = min(found) if found else len(ring) - 1
+        self.skipped_bytes += skip
+        ring.consume(skip)
+        return bool(found)
+
+    def _track_seq(self, seq):
+        if self.last_seq is not None:
+            gap = (seq - self.last_seq - 1) & 0xFFFF
+            # 过大的跳变视为设备复位, 不计入丢帧
+            if gap < 0x8000:
+                self.seq_gaps += gap
+        self.last_seq = seq
+
+
+# ========== 主机 -> 设备命令 ==========
+# 命令帧: A5 5A | 命令 | 长度 | 负载 | CRC16 (覆盖 命令..负载)
+CMD_HEADER = b'\xA5\x5A'
+CMD_SET_CHANNEL_MASK = 0x01   # u8 通道掩码
+CMD_SET_RECORD_LENGTH = 0x02  # u16 每通道样本数, 0 = 平分样本预算
+CMD_SET_FRAME_DELAY = 0x03    # u16 帧间隔 ms
+CMD_RUN_STOP = 0x04           # u8 1 = 运行
+CMD_SET_ENCODING = 0x05       # u8 0 = 16位, 1 = 10位紧凑, 2 = 差分
+CMD_SET_ADC_MODE = 0x06       # u8 ADC_MODES 中的序号
+CMD_SET_TRIGGER = 0x07        # 模式(u8) | 源通道(u8) | 斜率(u8 1=下降) | 电平(u16 ADC计数) | 预触发%(u8) | 标志(u8)
+CMD_SET_STREAM = 0x08         # u8 1 = 无间隙流模式
+CMD_SET_CREDITS = 0x09        # u16 可发送的帧序号上限; 空负载 = 关闭信用流控
+TRIG_FLAG_DITHER = 0x01       # 帧间随机错开采样相位, 供等效时间采样使用
+
+# CMD_SET_ENCODING 的编码序号; 差分编码压缩后不小于紧凑编码时设备自动改发紧凑帧
+WAVE_ENCODINGS = (WAVE_RAW16, WAVE_PACKED10, WAVE_DELTA)
+
+
+def wave_payload_size(total, encoding):
+    """一帧样本部分的最大字节数 (差分帧不小于紧凑编码时设备改发紧凑帧, 按紧凑编码计)"""
+    return total * 2 if encoding == WAVE_RAW16 else total // 4 * 5
+
+# ADC 模式: 定时触发 10 位 / 自由运行 10 位 / 自由运行 8 位
+ADC_MODES = ('normal', 'fast', 'fast8')
+# 设备端硬件触发: 关 (连续采集) / 常规 (只发送触发帧) / 自动 (超时强制触发)
+HW_TRIGGER_MODES = ('off', 'normal', 'auto')
+# 主波形渲染后端: Tk 画布矢量图元 / NumPy 帧缓冲 + PhotoImage
+RENDER_BACKENDS = ('canvas', 'raster')
+
+
+def build_command(cmd, payload=b''):
+    body = bytes([cmd, len(payload)]) + payload
+    return CMD_HEADER + body + struct.pack('<H', binascii.crc_hqx(body, 0xFFFF))
+
+
+# ========== 采集线程 -> GUI 帧交接队列 ==========
+class WaveFrame:
+    """一帧解码后的波形 (3, N) 及其时间信息
+
+    sample_interval: 同一通道相邻样本的实际间隔 (秒), 旧版固件无时间戳时为 None
+    timestamp_us: 首样本的设备 micros(), 无时间戳时为 None
+    trigger_pos: 触发电平穿越的位置 (样本, 含小数), 未触发时为 None
+    seq: V3 帧序号, 旧版帧为 None
+    sample_index: 流模式下首样本的行序号 (u32), 其他模式为 None
+    channels: 解码本帧时设备实际发送的通道列表; GUI 以此为准, 不读采集线程的布局属性
+    """
+    __slots__ = ('data', 'sample_interval', 'timestamp_us', 'trigger_pos', 'seq', 'sample_index', 'channels')
+
+    def __init__(self, data, sample_interval=None, timestamp_us=None, trigger_pos=None, seq=None, sample_index=None,
+                 channels=None):
+        self.data = data
+        self.sample_interval = sample_interval
+        self.timestamp_us = timestamp_us
+        self.trigger_pos = trigger_pos
+        self.seq = seq
+        self.sample_index = sample_index
+        self.channels = channels
+
+
+class DeviceClock:
+    """把设备 32 位 micros() 时间戳展开为连续的秒数; 无时间戳的帧使用主机到达时刻"""
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.seconds = 0.0
+        self._prev_us = None
+
+    def update(self, timestamp_us):
+        if timestamp_us is None:
+            self.seconds = time.monotonic()
+        else:
+            if self._prev_us is not None:
+                self.seconds += ((timestamp_us - self._prev_us) & 0xFFFFFFFF) * 1e-6
+            self._prev_us = timestamp_us
+        return self.seconds
+
+
+def stamp_sample_interval(start_us, end_us, samples_per_chan, channels, slots=None):
+    """由首/末样本时间戳计算每通道采样间隔 (秒)
+
+    每行 slots 个转换 (默认等于通道数; 流模式每行另有一个电位器转换), 首样本为第一行的
+    通道 0, 末样本为最后一行的最后一个通道。
+    """
+    slots = slots or channels
+    conversions = (samples_per_chan - 1) * slots + channels - 1
+    elapsed = (end_us - start_us) & 0xFFFFFFFF
+    if conversions < 1 or elapsed == 0:
+        return None
+    return elapsed * 1e-6 / conversions * slots
+
+
+class EquivalentTimeSampler:
+    """等效时间采样: 按触发位置把多次触发的帧归入细分时间格, 拼成高分辨率合成记录
+
+    合成记录的触发点固定在第 position * (n-1) 个原始样本处, 各帧样本按其相对本帧触发点的
+    时间 (含整数与小数部分) 落入该固定锚点两侧的格; 每个原始采样间隔细分为 factor 格,
+    同一格以最新样本为准; 尚未填充的格在输出时由相邻已填充格线性插值。仅适用于重复信号。
+    add() 在采集线程调用, reset()/set_factor() 可能来自 GUI 线程, 由 lock 串行化。
+    """
+    def __init__(self, factor=8, position=0.5):
+        self.factor = factor
+        self.position = position
+        self.lock = threading.Lock()
+        self.active = False
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.composite = None
+            self.filled = None
+
+    def set_factor(self, factor, position=None):
+        with self.lock:
+            self.factor = factor
+            if position is not None:
+                self.position = position
+            self.composite = None
+            self.filled = None
+
+    @property
+    def fill_ratio(self):
+        filled = self.filled
+        return float(filled.mean()) if filled is not None else 0.0
+
+    def add(self, frame):
+        """加入一帧已触发的 WaveFrame, 返回合成帧
+
+        帧无触发位置或时间戳 (硬件触发关闭、旧版设备、auto 扫描放行的帧) 时原样返回, 并将 active 置为 False。
+        """
+        if frame.trigger_pos is None or frame.sample_interval is None:
+            self.active = False
+            return frame
+        self.active = True
+        with self.lock:
+            return self._add(frame)
+
+    def _add(self, frame):
+        data = frame.data
+        channels, n = data.shape
+        nbins = n * self.factor
+        composite, filled = self.composite, self.filled
+        if composite is None or composite.shape != (channels, nbins):
+            composite = self.composite = np.zeros((channels, nbins), dtype=np.float32)
+            filled = self.filled = np.zeros(nbins, dtype=bool)
+        # 锚点对所有帧相同; 各帧触发位置不同只改变落格偏移, 不改变合成记录的时间原点
+        anchor = round(self.position * (n - 1))
+        shift = anchor - frame.trigger_pos
+        bins = np.floor((np.arange(n) + shift) * self.factor + 0.5).astype(np.intp)
+        valid = (bins >= 0) & (bins < nbins)
+        bins = bins[valid]
+        composite[:, bins] = data[:, valid]
+        filled[bins] = True
+        idx = np.flatnonzero(filled)
+        out = np.empty_like(composite)
+        grid = np.arange(nbins)
+        for ch in range(channels):
+            out[ch] = np.interp(grid, idx, composite[ch, idx])
+        return WaveFrame(out, frame.sample_interval / self.factor, frame.timestamp_us,
+                         float(anchor * self.factor), frame.seq, channels=frame.channels)
+
+
+def hysteresis_crossings(x, level, hysteresis=0.0, rising=True):
+    """带迟滞的电平穿越, 返回小数样本位置
+
+    上升沿须先回到 level - hysteresis 以下才重新布防 (下降沿对称), 抑制噪声引起的重复触发。
+    """
+    x = np.asarray(x, dtype=np.float64)
+    if not rising:
+        x, level = -x, -level
+    state = np.where(x >= level, 1, np.where(x < level - hysteresis, -1, 0)).astype(np.int8)
+    # 状态 0 (迟滞带内) 沿用之前最近的非零状态
+    last = np.where(state != 0, np.arange(len(x)), 0)
+    np.maximum.accumulate(last, out=last)
+    held = state[last]
+    i = np.flatnonzero((held[1:] == 1) & (held[:-1] == -1)) + 1
+    x0, x1 = x[i - 1], x[i]
+    return (i - 1) + (level - x0) / (x1 - x0)
+
+
+class SoftwareTrigger:
+    """采集线程上的软件触发引擎
+
+    在触发源通道上向量化查找触发事件, 线性插值得到小数样本位置, 并跳过释抑时间内的事件:
+      edge:        带迟滞的边沿
+      pulse_width: 脉宽大于/小于设定值的脉冲, 在脉冲后沿触发
+      runt:        越过 level 但未到达 level_high 即返回的欠幅脉冲, 在返回处触发
+      window:      离开 (rising) 或进入 (下降) [level, level_high] 窗口
+    对齐时整段记录平移, 使触发点落在 position 处; 移出原记录的部分以端点值延续。
+    """
+    MODES = ('none', 'edge', 'pulse_width', 'runt', 'window')
+    SWEEPS = ('auto', 'normal')
+
+    def __init__(self):
+        self.mode = 'none'
+        self.sweep = 'auto'           # auto: 超时无触发时照常显示未对齐的帧
+        self.source = 0
+        self.level = 2.5
+        self.level_high = 3.5
+        self.rising = True
+        self.hysteresis = 0.05        # V
+        self.pulse_condition = '>'
+        self.pulse_width = 1e-3       # 秒
+        self.holdoff = 0.0            # 秒
+        self.position = 0.5
+        self.auto_timeout = 0.1       # 秒
+        self.triggered = 0
+        self.reset()
+
+    def reset(self):
+        self.clock = DeviceClock()
+        self._last_trigger = None
+        self._last_fire = None
+
+    def find(self, x, interval):
+        """返回触发源数据 x 中全部触发事件的小数样本位置 (升序)"""
+        h = self.hysteresis
+        if self.mode == 'edge':
+            return hysteresis_crossings(x, self.level, h, self.rising)
+        if self.mode == 'pulse_width':
+            lead = hysteresis_crossings(x, self.level, h, self.rising)
+            trail = hysteresis_crossings(x, self.level, h, not self.rising)
+            j = np.searchsorted(trail, lead)
+            ok = j < len(trail)
+            lead, trail = lead[ok], trail[j[ok]]
+            width = (trail - lead) * interval
+            hit = width > self.pulse_width if self.pulse_condition == '>' else width < self.pulse_width
+            return trail[hit]
+        if self.mode == 'runt':
+            near, far = (self.level, self.level_high) if self.rising else (self.level_high, self.level)
+            enter = hysteresis_crossings(x, near, h, self.rising)
+            leave = hysteresis_crossings(x, near, h, not self.rising)
+            reach = hysteresis_crossings(x, far, h, self.rising)
+            j = np.searchsorted(leave, enter)
+            ok = j < len(leave)
+            enter, leave = enter[ok], leave[j[ok]]
+            runt = np.searchsorted(reach, enter) == np.searchsorted(reach, leave)
+            return leave[runt]
+        if self.mode == 'window':
+            if self.rising:
+                events = (hysteresis_crossings(x, self.level_high, h, True),
+                          hysteresis_crossings(x, self.level, h, False))
+            else:
+                events = (hysteresis_crossings(x, self.level_high, h, False),
+                          hysteresis_crossings(x, self.level, h, True))
+            return np.sort(np.concatenate(events))
+        return np.empty(0)
+
+    def process(self, frame, interval, align=True):
+        """对一帧 WaveFrame 求触发
+
+        返回触发后的帧 (align 时为平移对齐的整段记录, 否则为原数据并附触发位置);
+        未触发时 normal 扫描返回 None; auto 扫描在 auto_timeout 内未再触发时按原帧率放行未对齐的帧,
+        刚触发过则丢弃, 避免稳定画面中夹杂未对齐的帧。
+        """
+        data = frame.data
+        n = data.shape[1]
+        now = time.monotonic()
+        frame_start = self.clock.update(frame.timestamp_us)
+        pre = self.position * (n - 1)
+        events = self.find(data[self.source], interval)
+        if self._last_trigger is not None and self.holdoff > 0:
+            events = events[frame_start + events * interval >= self._last_trigger + self.holdoff]
+        if len(events):
+            # 取最接近预设位置的事件: 对齐时平移量最小; 等效时间采样时落在合成记录锚点附近, 丢弃的样本最少
+            pos = float(events[np.argmin(np.abs(events - pre))])
+            self._last_trigger = frame_start + pos * interval
+            self._last_fire = now
+            self.triggered += 1
+            if not align:
+                return WaveFrame(data, interval, frame.timestamp_us, pos, frame.seq, channels=frame.channels)
+            # 以小数偏移线性重采样, 使触发点精确落在 pre 处
+            src = np.clip(np.arange(n) + (pos - pre), 0, n - 1)
+            k = src.astype(np.intp)
+            f = (src - k).astype(data.dtype)
+            k1 = np.minimum(k + 1, n - 1)
+            out = data[:, k] * (1 - f) + data[:, k1] * f
+            return WaveFrame(out, interval, frame.timestamp_us, pre, frame.seq, channels=frame.channels)
+        if self.sweep == 'auto' and (self._last_fire is None or now - self._last_fire >= self.auto_timeout):
+            return frame
+        return None
+
+
+class SegmentArena:
+    """分段采集存储
+
+    创建时按 (段数, 启用通道数, 每段样本数) 预分配 int16 数组, 以 1 mV 为单位保存电压,
+    每启用通道每样本 2 字节; 每段另存时间 (设备时钟展开后的秒数) 与帧序号。
+    更长的帧被截断。只由采集线程写入, GUI 只读取 count 以内的段。
+    """
+    SCALE = 1e-3  # V / LSB
+
+    def __init__(self, capacity, samples, channels):
+        self.capacity = capacity
+        self.channels = list(channels)
+        self.data = np.empty((capacity, len(self.channels), samples), dtype=np.int16)
+        self.lengths = np.zeros(capacity, dtype=np.uint32)
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.seqs = np.full(capacity, -1, dtype=np.int64)
+        self.clock = DeviceClock()
+        self.count = 0
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def append(self, frame):
+        """写入一帧 WaveFrame; 存储已满时返回 False"""
+        if self.full:
+            return False
+        data = frame.data
+        i = self.count
+        n = min(data.shape[1], self.data.shape[2])
+        self.data[i, :, :n] = np.rint(data[self.channels, :n] * (1.0 / self.SCALE))
+        self.lengths[i] = n
+        self.times[i] = self.clock.update(frame.timestamp_us)
+        self.seqs[i] = -1 if frame.seq is None else frame.seq
+        self.count = i + 1
+        return True
+
+    def segment(self, i):
+        """第 i 段的电压数据 (3 通道, 样本), float32, 未存储的通道为 0"""
+        n = self.lengths[i]
+        out = np.zeros((3, n), dtype=np.float32)
+        out[self.channels] = self.data[i, :, :n] * self.SCALE
+        return out
+
+
+def line_pixels(x, y, width, height):
+    """折线顶点 (x, y) 逐段展开为整数像素坐标 (DDA), 返回 (px, py), 可能含画布外的点
+
+    远超画布的顶点先收到画布边缘外一像素, 避免展开出过多像素; NaN 端点的线段跳过。
+    """
+    x = np.clip(x, -1, width)
+    y = np.clip(y, -1, height)
+    x0, y0, dx, dy = x[:-1], y[:-1], np.diff(x), np.diff(y)
+    ok = np.isfinite(dx) & np.isfinite(dy)
+    if not ok.all():
+        x0, y0, dx, dy = x0[ok], y0[ok], dx[ok], dy[ok]
+    steps = (np.maximum(np.abs(dx), np.abs(dy)) + 1).astype(np.intp)
+    seg = np.repeat(np.arange(len(steps)), steps)
+    offset = np.arange(len(seg)) - np.repeat(np.cumsum(steps) - steps, steps)
+    t = offset / np.maximum(steps - 1, 1)[seg]
+    px = np.rint(x0[seg] + dx[seg] * t).astype(np.intp)
+    py = np.rint(y0[seg] + dy[seg] * t).astype(np.intp)
+    return px, py
+
+
+class RasterRenderer:
+    """离屏光栅渲染: 在 NumPy RGB 帧缓冲中画折线, 每帧整体转成一张 PPM 交给 PhotoImage
+
+    网格画在背景缓冲中, 只在布局变化时重画; 每帧先复制背景再叠加波形。折线由 line_pixels()
+    展开后一次性写入, 开销与折线覆盖的像素数成正比, 与图元数量无关。
+    """
+    def __init__(self):
+        self.background = None
+        self.frame = None
+        self.header = b''
+
+    def reset(self, width, height, bg):
+        self.background = np.empty((height, width, 3), dtype=np.uint8)
+        self.background[:] = bg
+        self.frame = np.empty_like(self.background)
+        self.header = f"P6 {width} {height} 255\n".encode()
+
+    def begin(self):
+        np.copyto(self.frame, self.background)
+
+    def polyline(self, coords, color, width=1, dash=None, target=None):
+        """coords 为交织的 x0 y0 x1 y1 ... (或 (点数, 2)); dash=(实, 空) 像素; NaN 端点的线段跳过"""
+        fb = self.frame if target is None else target
+        h, w = fb.shape[:2]
+        pts = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        if len(pts) < 2:
+            return
+        px, py = line_pixels(pts[:, 0], pts[:, 1], w, h)
+        if dash is not None:
+            keep = np.arange(len(px)) % (dash[0] + dash[1]) < dash[0]
+            px, py = px[keep], py[keep]
+        for ox, oy in ((0, 0), (1, 0), (0, 1))[:1 if width < 2 else 3]:
+            qx, qy = px + ox, py + oy
+            inside = (qx >= 0) & (qx < w) & (qy >= 0) & (qy < h)
+            fb[qy[inside], qx[inside]] = color
+
+    def to_ppm(self):
+        return self.header + self.frame.tobytes()
+
+
+class PhosphorAccumulator:
+    """数字荧光 (余辉) 显示: 每个通道一张 像素行 x 像素列 的命中直方图
+
+    采集线程把每一帧 (而非每个显示帧) 按当前屏幕映射展开成折线像素累加进直方图, 偶发毛刺与
+    抖动在数千帧之后仍然可见。指数衰减不逐帧缩放整张直方图, 而是让新命中的权重按 1/decay
+    增长, 显示时按峰值归一, 因此每帧开销只与折线覆盖的像素数有关; 权重过大时整体归一一次。
+    infinite 模式不衰减。屏幕映射 (尺寸、缩放、档位、通道) 改变时直方图清空。
+    采集线程累加, GUI 线程配置与着色, 由一把锁保护。
+    """
+    MODES = ('off', 'decay', 'infinite')
+
+    def __init__(self, mode='off', decay=0.9):
+        self.mode = mode
+        self.decay = decay
+        self.key = None
+        self.hist = None
+        self._xs = {}
+        self._palettes = {}
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            if self.hist is not None:
+                self.hist.fill(0)
+            self.weight = 1.0
+            self.frames = 0     # 已累加的采集帧数
+
+    def configure(self, width, height, x_scale, gains, offsets, channels):
+        """GUI 线程: 屏幕 y = 电压 * gains[通道] + offsets[通道]; x 与主波形的时间轴网格相同
+
+        电位器读数的 1 LSB 抖动不应清空余辉: 档位变化不足 2%、移位不足 2 像素时沿用原映射
+        """
+        key = (width, height, x_scale, tuple(gains), tuple(offsets), tuple(channels))
+        old = self.key
+        if old is not None and old[:3] == key[:3] and old[5] == key[5]:
+            gain_ratio = np.asarray(key[3]) / np.asarray(old[3])
+            if np.all(np.abs(gain_ratio - 1) < 0.02) and np.all(np.abs(np.subtract(key[4], old[4])) < 2):
+                return
+        with self._lock:
+            if self.hist is None or self.hist.shape != (3, height, width):
+                self.hist = np.zeros((3, height, width), dtype=np.float32)
+            else:
+                self.hist.fill(0)
+            self.key = key
+            self._xs = {}
+            self.weight = 1.0
+            self.frames = 0
+
+    def add(self, data):
+        """采集线程: 累加一帧 (通道, N) 电压"""
+        if self.mode == 'off' or self.key is None or data.shape[1] < 2:
+            return
+        with self._lock:
+            width, height, x_scale, gains, offsets, channels = self.key
+            n = data.shape[1]
+            xs = self._xs.get(n)
+            if xs is None:
+                xs = np.clip((0.5 + (np.arange(n) / (n - 1) - 0.5) * x_scale) * width, 0, width)
+                self._xs[n] = xs
+            if self.mode == 'decay':
+                self.weight /= self.decay
+                if self.weight > 1e6:
+                    self.hist /= self.weight
+                    self.weight = 1.0
+            for ch in channels:
+                px, py = line_pixels(xs, data[ch] * gains[ch] + offsets[ch], width, height)
+                inside = (px >= 0) & (px < width) & (py >= 0) & (py < height)
+                np.add.at(self.hist[ch], (py[inside], px[inside]), self.weight)
+            self.frames += 1
+
+    def palette(self, rgb):
+        """强度分级色表: 低命中为暗的通道色, 随命中增多变亮, 最高处过渡到白色"""
+        lut = self._palettes.get(rgb)
+        if lut is None:
+            g = np.linspace(0.0, 1.0, 256)[:, None]
+            hot = np.clip((g - 0.7) / 0.3, 0.0, 1.0)
+            lut = np.asarray(rgb, dtype=np.float64) * (0.25 + 0.75 * np.minimum(g / 0.7, 1.0)) * (1 - hot) + 255 * hot
+            lut[0] = 0
+            lut = self._palettes[rgb] = lut.astype(np.uint8)
+        return lut
+
+    def render(self, frame, colors):
+        """GUI 线程: 各通道直方图按峰值归一、开方压缩后查色表, 与帧缓冲逐像素取较亮者
+
+        只处理有命中的像素。decay 模式下衰减到最低一级以下的像素直接清零, 使其集合不随时间无限增长;
+        infinite 模式从不清除命中, 低于最低一级的像素按第 1 级显示, 偶发毛刺始终可见
+        """
+        pixels = frame.reshape(-1, 3)
+        with self._lock:
+            if self.key is None or frame.shape[:2] != self.hist.shape[1:]:
+                return
+            for ch in self.key[5]:
+                flat = self.hist[ch].ravel()
+                idx = np.flatnonzero(flat != 0)  # 比直接对浮点数组求 nonzero 快约 3 倍
+                if not len(idx):
+                    continue
+                values = flat[idx]
+                level = (np.sqrt(values * (1.0 / values.max())) * 255).astype(np.uint8)
+                faded = level == 0
+                if faded.any():
+                    if self.mode == 'decay':
+                        flat[idx[faded]] = 0
+                    else:
+                        level[faded] = 1
+                pixels[idx] = np.maximum(pixels[idx], self.palette(colors[ch])[level])
+
+
+class PeakDecimator:
+    """峰值检测抽取: 样本多于像素列时每列只保留 min/max, 绘制开销只与画布宽度有关, 毛刺不会被抽掉
+
+    结果按 (数据对象, 数据版本, x 网格, 宽度) 缓存; 同一数据重绘 (暂停、调整垂直档位) 时直接复用。
+    """
+    def __init__(self):
+        self._key = None
+        self._result = None
+
+    def decimate(self, data, xs, width, version=None):
+        """data (通道, N), xs 为各样本屏幕 x (单调不减)
+
+        样本数不超过 2 倍列数时原样返回 (xs, data): 抽取结果每列两个点, 此时不会比原始折线点少,
+        而原始折线经过每一个样本, 单样本毛刺本来就不会丢; 否则返回每列两个点的 x 与
+        (通道, 2*列数) 的交替 min/max。
+        """
+        key = self._key
+        if key is not None and key[0] is data and key[1] == version and key[2] is xs and key[3] == width:
+            return self._result
+        n = data.shape[1]
+        if n <= 2 * width:
+            result = (xs, data)
+        else:
+            col = np.minimum(xs.astype(np.intp), width - 1)
+            starts = np.flatnonzero(np.diff(col, prepend=-1))
+            lo = np.minimum.reduceat(data, starts, axis=1)
+            hi = np.maximum.reduceat(data, starts, axis=1)
+            env = np.stack((lo, hi), axis=2).reshape(data.shape[0], -1)
+            result = (np.repeat(col[starts] + 0.5, 2), env)
+        self._key = (data, version, xs, width)
+        self._result = result
+        return result
+
+
+class RollBuffer:
+    """滚动 (条带图) 模式的长记录环形缓冲
+
+    原始样本环之外另存每 BLOCK 个样本一组的 min/max 环: 显示窗口很长时直接在 min/max 环上
+    抽取, 因此无论记录了几分钟还是几小时, 每次重绘的开销都有上限。
+    采集线程写入, GUI 线程抽取, 由一把锁保护。
+    """
+    BLOCK = 256
+
+    def __init__(self, capacity=1 << 20, blocks=1 << 16, channels=3):
+        self.raw = np.zeros((channels, capacity), dtype=np.float32)
+        self.mins = np.zeros((channels, blocks), dtype=np.float32)
+        self.maxs = np.zeros((channels, blocks), dtype=np.float32)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.total = 0          # 累计写入的样本数 (每通道)
+            self.interval = None
+
+    @staticmethod
+    def _gather(ring, start, stop):
+        return ring[:, np.arange(start, stop) % ring.shape[1]]
+
+    def append(self, data, interval):
+        with self._lock:
+            cap = self.raw.shape[1]
+            data = data[:, -cap:]
+            n = data.shape[1]
+            start = self.total % cap
+            first = min(n, cap - start)
+            self.raw[:, start:start + first] = data[:, :first]
+            self.raw[:, :n - first] = data[:, first:]
+            b0 = self.total // self.BLOCK
+            self.total += n
+            self.interval = interval
+            b1 = self.total // self.BLOCK
+            if b1 > b0:
+                # 新完成的块: 样本仍在原始环中
+                blk = self._gather(self.raw, b0 * self.BLOCK, b1 * self.BLOCK)
+                blk = blk.reshape(blk.shape[0], -1, self.BLOCK)
+                idx = np.arange(b0, b1) % self.mins.shape[1]
+                # fmin/fmax 忽略流模式补齐的 NaN, 只有整块缺失时才为 NaN
+                self.mins[:, idx] = np.fmin.reduce(blk, axis=2)
+                self.maxs[:, idx] = np.fmax.reduce(blk, axis=2)
+
+    def decimate(self, span, columns):
+        """把最近 span 个样本按 columns 列做 min/max 抽取, 最新样本在最后一列
+
+        每列的样本数只由 span 决定; 数据不足一屏时只返回最右侧有数据的列, 不拉伸。
+        返回 (列号, 最小值, 最大值)。
+        """
+        span = int(span)
+        with self._lock:
+            if span <= 0 or columns <= 0 or self.total == 0:
+                return np.empty(0, dtype=np.intp), None, None
+            if span / columns >= self.BLOCK and self.total >= self.BLOCK:
+                nblocks = min(self.total, span) // self.BLOCK
+                nblocks = min(nblocks, self.mins.shape[1])
+                end = self.total // self.BLOCK
+                lo = self._gather(self.mins, end - nblocks, end)
+                hi = self._gather(self.maxs, end - nblocks, end)
+                per_col = span / self.BLOCK / columns
+            else:
+                m = min(span, self.total, self.raw.shape[1])
+                lo = hi = self._gather(self.raw, self.total - m, self.total)
+                per_col = span / columns
+        m = lo.shape[1]
+        col = columns - 1 - ((m - 1 - np.arange(m)) / per_col).astype(np.intp)
+        starts = np.flatnonzero(np.diff(col, prepend=-1))
+        return col[starts], np.fmin.reduceat(lo, starts, axis=1), np.fmax.reduceat(hi, starts, axis=1)
+
+
+class StreamAssembler:
+    """无间隙流模式: 按帧携带的行序号把各帧接成连续时间线, 并统计真实丢失的样本
+
+    序号连续的帧直接拼接; 序号向前跳变说明设备来不及发送而丢弃了整帧 (或帧在链路上损坏),
+    缺失的行以 NaN 补齐, 时间线在丢失之后仍与设备时钟对齐。跳变超过 max_gap 行或序号回退
+    视为设备重新开始采集, 时间线从新序号继续而不计为丢失。
+    """
+    def __init__(self, max_gap=1 << 20):
+        self.max_gap = max_gap
+        self.reset()
+
+    def reset(self):
+        self.next_row = None
+        self.rows = 0           # 时间线上的累计行数 (含补齐的缺失行)
+        self.lost_rows = 0
+        self.loss_events = 0
+        self.restarts = 0
+
+    def feed(self, frame):
+        """返回接入时间线的数据 (通道, 缺失行 + 本帧行), 缺失部分为 NaN"""
+        data = frame.data
+        n = data.shape[1]
+        gap = 0
+        if self.next_row is not None:
+            gap = (frame.sample_index - self.next_row) & 0xFFFFFFFF
+            if gap > self.max_gap:
+                self.restarts += 1
+                gap = 0
+            elif gap:
+                self.lost_rows += gap
+                self.loss_events += 1
+        self.next_row = (frame.sample_index + n) & 0xFFFFFFFF
+        self.rows += gap + n
+        if gap:
+            filled = np.full((data.shape[0], gap + n), np.nan, dtype=data.dtype)
+            filled[:, gap:] = data
+            return filled
+        return data
+
+
+class CreditPacer:
+    """信用流控: 按已收到的帧序号向设备授予 "帧序号上限", 取代固定帧间隔
+
+    设备只在下一帧序号小于上限时发送波形帧, 在途数据因此不超过 window 帧; window 同时受
+    操作系统串口接收缓冲区限制, 保证缓冲区不会溢出。主机消费得越快上限推进得越快,
+    链路利用率随之提高。上限是绝对序号: 丢失的授权由下一次授权覆盖, 丢帧也不会卡死
+    (设备等待授权期间仍发送控制帧, 其序号让上限继续推进)。
+    """
+    OS_RX_BUFFER = 4096  # 保守估计的操作系统串口接收缓冲区 (Windows 默认值)
+
+    def __init__(self, window=4):
+        self.window = window
+        self.frame_bytes = 1
+        self.lock = threading.Lock()  # reset() 来自 GUI 线程, update() 在采集线程
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.limit = None
+            self.grants = 0
+
+    def effective_window(self, backlog=0):
+        """扣除主机尚未消费的帧 (backlog) 后的可用窗口 (帧)"""
+        window = min(self.window, max(1, self.OS_RX_BUFFER // self.frame_bytes))
+        return max(0, window - backlog)
+
+    def update(self, last_seq, backlog=0):
+        """返回需要下发的新上限; 剩余额度超过半个窗口或上限不变时返回 None"""
+        if last_seq is None:
+            return None
+        window = self.effective_window(backlog)
+        limit = (last_seq + 1 + window) & 0xFFFF
+        with self.lock:
+            if self.limit is not None:
+                if limit == self.limit:
+                    return None
+                remaining = (self.limit - last_seq - 1) & 0xFFFF
+                if remaining < 0x8000 and remaining * 2 > window:
+                    return None
+            self.limit = limit
+            self.grants += 1
+        return limit
+
+
+class FrameQueue:
+    """有界单锁交接队列
+
+    latest:   队列满时丢弃最旧的波形帧 (新帧优先, 适合实时显示)
+    keep_all: 队列满时等待 GUI 取走, 超时才丢弃新帧 (适合记录)
+    控制帧不参与丢弃, 保证按键事件不丢失。
+    另有一张波形缓冲区空闲表: 被丢弃或被 GUI 用完的帧数据经 recycle() 归还,
+    采集线程解码时用 buffer() 取出复用, 稳态下每帧不再分配新数组。
+    """
+    POLICIES = ('latest', 'keep_all')
+
+    def __init__(self, capacity=8, policy='latest'):
+        self.capacity = capacity
+        self.policy = policy
+        self._items = collections.deque()
+        self._cond = threading.Condition(threading.Lock())
+        self._free = []
+        self.published = 0
+        self.dropped = 0
+
+    def put(self, kind, frame, timeout=0.1):
+        with self._cond:
+            if kind == FRAME_WAVE and len(self._items) >= self.capacity:
+                if self.policy == 'keep_all':
+                    if not self._cond.wait_for(lambda: len(self._items) < self.capacity, timeout):
+                        self.dropped += 1
+                        self._recycle(frame.data)
+                        return False
+                else:
+                    self._drop_oldest_wave()
+            self._items.append((kind, frame))
+            self.published += 1
+            return True
+
+    def _drop_oldest_wave(self):
+        for i, (kind, _) in enumerate(self._items):
+            if kind == FRAME_WAVE:
+                self._recycle(self._items[i][1].data)
+                del self._items[i]
+                self.dropped += 1
+                return
+
+    def buffer(self, shape):
+        """采集线程: 取一块形状相符的空闲 float32 缓冲区, 没有时新分配"""
+        with self._cond:
+            for i, buf in enumerate(self._free):
+                if buf.shape == shape:
+                    return self._free.pop(i)
+        return np.empty(shape, dtype=np.float32)
+
+    def recycle(self, data):
+        """归还已无人引用的帧数据"""
+        with self._cond:
+            self._recycle(data)
+
+    def _recycle(self, data):
+        if data.dtype == np.float32:
+            self._free.append(data)
+            if len(self._free) > self.capacity * 2:
+                del self._free[0]
+
+    def backlog(self):
+        """尚未被 GUI 取走的波形帧数"""
+        with self._cond:
+            return sum(1 for kind, _ in self._items if kind == FRAME_WAVE)
+
+    def drain(self):
+        """取出全部待处理帧 (按到达顺序)"""
+        with self._cond:
+            items = list(self._items)
+            self._items.clear()
+            self._cond.notify_all()
+        return items
+
 
 # ========== 新增：设置对话框 ==========
 class SettingsDialog:
@@ -64,6 +1125,19 @@ class SettingsDialog:
         self.font_size_var = tk.IntVar(value=self.app.config.get('font_size', 9))
         ttk.Spinbox(personal_frame, from_=8, to=14, textvariable=self.font_size_var, width=5).grid(row=6, column=1, sticky=tk.W)
 
+        # 渲染后端
+        ttk.Label(personal_frame, text="渲染后端:").grid(row=7, column=0, sticky=tk.W, padx=5, pady=5)
+        self.render_backend_var = tk.StringVar(value=self.app.config.get('render_backend', 'canvas'))
+        ttk.Combobox(personal_frame, textvariable=self.render_backend_var, values=list(RENDER_BACKENDS), state='readonly', width=12).grid(row=7, column=1, sticky=tk.W)
+
+        # 余辉 (数字荧光) 显示
+        ttk.Label(personal_frame, text="余辉模式:").grid(row=8, column=0, sticky=tk.W, padx=5, pady=5)
+        self.persistence_mode_var = tk.StringVar(value=self.app.config.get('persistence_mode', 'off'))
+        ttk.Combobox(personal_frame, textvariable=self.persistence_mode_var, values=list(PhosphorAccumulator.MODES), state='readonly', width=12).grid(row=8, column=1, sticky=tk.W)
+        ttk.Label(personal_frame, text="余辉衰减 (每帧):").grid(row=9, column=0, sticky=tk.W, padx=5, pady=5)
+        self.persistence_decay_var = tk.DoubleVar(value=self.app.config.get('persistence_decay', 0.9))
+        ttk.Spinbox(personal_frame, from_=0.5, to=0.999, increment=0.01, textvariable=self.persistence_decay_var, width=8).grid(row=9, column=1, sticky=tk.W)
+
         # ========== 专业功能 ==========
         pro_frame = ttk.Frame(notebook)
         notebook.add(pro_frame, text="专业功能")
@@ -84,8 +1158,8 @@ class SettingsDialog:
 
         # 触发模式
         ttk.Label(pro_frame, text="触发模式:").grid(row=3, column=0, sticky=tk.W, padx=5, pady=5)
-        self.trigger_mode_var = tk.StringVar(value=self.app.config.get('trigger_mode', 'edge'))
-        modes = ['edge', 'pulse_width', 'video']
+        self.trigger_mode_var = tk.StringVar(value=self.app.config.get('trigger_mode', 'none'))
+        modes = list(SoftwareTrigger.MODES)
         ttk.Combobox(pro_frame, textvariable=self.trigger_mode_var, values=modes, state='readonly', width=15).grid(row=3, column=1, sticky=tk.W)
 
         # 数据导出
@@ -93,6 +1167,74 @@ class SettingsDialog:
         self.export_format_var = tk.StringVar(value=self.app.config.get('export_format', 'csv'))
         ttk.Combobox(pro_frame, textvariable=self.export_format_var, values=['csv', 'txt'], state='readonly', width=15).grid(row=4, column=1, sticky=tk.W)
 
+        # 丢帧策略
+        ttk.Label(pro_frame, text="丢帧策略:").grid(row=5, column=0, sticky=tk.W, padx=5, pady=5)
+        self.drop_policy_var = tk.StringVar(value=self.app.config.get('frame_drop_policy', 'latest'))
+        ttk.Combobox(pro_frame, textvariable=self.drop_policy_var, values=list(FrameQueue.POLICIES), state='readonly', width=15).grid(row=5, column=1, sticky=tk.W)
+
+        # 设备记录长度 / 帧间隔 (V3 固件)
+        ttk.Label(pro_frame, text="记录长度 (0=自动):").grid(row=6, column=0, sticky=tk.W, padx=5, pady=5)
+        self.record_length_var = tk.IntVar(value=self.app.config.get('record_length', 0))
+        ttk.Spinbox(pro_frame, from_=0, to=600, increment=4, textvariable=self.record_length_var, width=8).grid(row=6, column=1, sticky=tk.W)
+        ttk.Label(pro_frame, text="帧间隔 (ms):").grid(row=7, column=0, sticky=tk.W, padx=5, pady=5)
+        self.frame_delay_var = tk.IntVar(value=self.app.config.get('frame_delay_ms', 10))
+        ttk.Spinbox(pro_frame, from_=0, to=1000, increment=1, textvariable=self.frame_delay_var, width=8).grid(row=7, column=1, sticky=tk.W)
+        ttk.Label(pro_frame, text="ADC模式:").grid(row=8, column=0, sticky=tk.W, padx=5, pady=5)
+        self.adc_mode_var = tk.StringVar(value=self.app.config.get('adc_mode', 'normal'))
+        ttk.Combobox(pro_frame, textvariable=self.adc_mode_var, values=list(ADC_MODES), state='readonly', width=15).grid(row=8, column=1, sticky=tk.W)
+
+        # 等效时间采样 (需设备硬件触发)
+        self.ets_enabled_var = tk.BooleanVar(value=self.app.config.get('ets_enabled', False))
+        ttk.Checkbutton(pro_frame, text="等效时间采样", variable=self.ets_enabled_var).grid(row=9, column=0, columnspan=2, sticky=tk.W, padx=5)
+        ttk.Label(pro_frame, text="时间细分倍数:").grid(row=10, column=0, sticky=tk.W, padx=5, pady=5)
+        self.ets_factor_var = tk.IntVar(value=self.app.config.get('ets_factor', 8))
+        ttk.Spinbox(pro_frame, from_=2, to=64, increment=2, textvariable=self.ets_factor_var, width=8).grid(row=10, column=1, sticky=tk.W)
+        ttk.Label(pro_frame, text="分段采集段数:").grid(row=11, column=0, sticky=tk.W, padx=5, pady=5)
+        self.segment_count_var = tk.IntVar(value=self.app.config.get('segment_count', 1000))
+        ttk.Spinbox(pro_frame, from_=1, to=500000, increment=1000, textvariable=self.segment_count_var, width=8).grid(row=11, column=1, sticky=tk.W)
+
+        # 滚动模式
+        self.roll_auto_var = tk.BooleanVar(value=self.app.config.get('roll_auto', False))
+        ttk.Checkbutton(pro_frame, text="慢时基自动滚动显示", variable=self.roll_auto_var).grid(row=12, column=0, columnspan=2, sticky=tk.W, padx=5)
+        ttk.Label(pro_frame, text="滚动阈值 (s/div):").grid(row=13, column=0, sticky=tk.W, padx=5, pady=5)
+        self.roll_threshold_var = tk.DoubleVar(value=self.app.config.get('roll_threshold', 0.2))
+        ttk.Spinbox(pro_frame, from_=0.001, to=1000, increment=0.1, textvariable=self.roll_threshold_var, width=8).grid(row=13, column=1, sticky=tk.W)
+        self.stream_mode_var = tk.BooleanVar(value=self.app.config.get('stream_mode', False))
+        ttk.Checkbutton(pro_frame, text="无间隙流模式 (长时间记录)", variable=self.stream_mode_var).grid(row=14, column=0, columnspan=2, sticky=tk.W, padx=5)
+
+        # 信用流控 (取代帧间隔)
+        self.flow_control_var = tk.BooleanVar(value=self.app.config.get('flow_control', True))
+        ttk.Checkbutton(pro_frame, text="信用流控 (自适应帧率)", variable=self.flow_control_var).grid(row=15, column=0, columnspan=2, sticky=tk.W, padx=5)
+        ttk.Label(pro_frame, text="信用窗口 (帧):").grid(row=16, column=0, sticky=tk.W, padx=5, pady=5)
+        self.credit_window_var = tk.IntVar(value=self.app.config.get('credit_window', 4))
+        ttk.Spinbox(pro_frame, from_=1, to=64, increment=1, textvariable=self.credit_window_var, width=8).grid(row=16, column=1, sticky=tk.W)
+        ttk.Label(pro_frame, text="波形编码:").grid(row=17, column=0, sticky=tk.W, padx=5, pady=5)
+        self.wave_encoding_var = tk.StringVar(value=self.app.config.get('wave_encoding', WAVE_PACKED10))
+        ttk.Combobox(pro_frame, textvariable=self.wave_encoding_var, values=list(WAVE_ENCODINGS), state='readonly', width=15).grid(row=17, column=1, sticky=tk.W)
+
+        # ========== 软件触发 ==========
+        trig_frame = ttk.Frame(notebook)
+        notebook.add(trig_frame, text="触发")
+
+        ttk.Label(trig_frame, text="扫描方式:").grid(row=0, column=0, sticky=tk.W, padx=5, pady=5)
+        self.trigger_sweep_var = tk.StringVar(value=self.app.config.get('trigger_sweep', 'auto'))
+        ttk.Combobox(trig_frame, textvariable=self.trigger_sweep_var, values=list(SoftwareTrigger.SWEEPS), state='readonly', width=12).grid(row=0, column=1, sticky=tk.W)
+        ttk.Label(trig_frame, text="迟滞 (V):").grid(row=1, column=0, sticky=tk.W, padx=5, pady=5)
+        self.trigger_hysteresis_var = tk.DoubleVar(value=self.app.config.get('trigger_hysteresis', 0.05))
+        ttk.Spinbox(trig_frame, from_=0, to=2.5, increment=0.01, textvariable=self.trigger_hysteresis_var, width=8).grid(row=1, column=1, sticky=tk.W)
+        ttk.Label(trig_frame, text="上限电平 (V, 欠幅/窗口):").grid(row=2, column=0, sticky=tk.W, padx=5, pady=5)
+        self.trigger_level_high_var = tk.DoubleVar(value=self.app.config.get('trigger_level_high', 3.5))
+        ttk.Spinbox(trig_frame, from_=0, to=5, increment=0.1, textvariable=self.trigger_level_high_var, width=8).grid(row=2, column=1, sticky=tk.W)
+        ttk.Label(trig_frame, text="脉宽条件:").grid(row=3, column=0, sticky=tk.W, padx=5, pady=5)
+        self.pulse_condition_var = tk.StringVar(value=self.app.config.get('pulse_condition', '>'))
+        ttk.Combobox(trig_frame, textvariable=self.pulse_condition_var, values=['>', '<'], state='readonly', width=5).grid(row=3, column=1, sticky=tk.W)
+        ttk.Label(trig_frame, text="脉宽 (μs):").grid(row=4, column=0, sticky=tk.W, padx=5, pady=5)
+        self.pulse_width_var = tk.DoubleVar(value=self.app.config.get('pulse_width_us', 1000.0))
+        ttk.Spinbox(trig_frame, from_=1, to=1000000, increment=100, textvariable=self.pulse_width_var, width=10).grid(row=4, column=1, sticky=tk.W)
+        ttk.Label(trig_frame, text="释抑 (ms):").grid(row=5, column=0, sticky=tk.W, padx=5, pady=5)
+        self.holdoff_var = tk.DoubleVar(value=self.app.config.get('trigger_holdoff_ms', 0.0))
+        ttk.Spinbox(trig_frame, from_=0, to=10000, increment=10, textvariable=self.holdoff_var, width=10).grid(row=5, column=1, sticky=tk.W)
+
         # 按钮
         btn_frame = ttk.Frame(self.window)
         btn_frame.pack(fill=tk.X, padx=10, pady=10)
@@ -100,7 +1242,7 @@ class SettingsDialog:
         ttk.Button(btn_frame, text="取消", command=self.window.destroy).pack(side=tk.RIGHT, padx=5)
 
     def save_reference(self):
-        self.app.reference_waveform = [row[:] for row in self.app.current_data]
+        self.app.reference_waveform = self.app.current_data.copy()
         messagebox.showinfo("参考波形", "已保存当前波形为参考！")
 
     def clear_reference(self):
@@ -114,10 +1256,45 @@ class SettingsDialog:
             self.app.config[f'color_ch{i}'] = self.color_vars[i].get()
         self.app.config['grid_density'] = self.grid_density_var.get()
         self.app.config['font_size'] = self.font_size_var.get()
+        self.app.config['render_backend'] = self.render_backend_var.get()
+        self.app.config['persistence_mode'] = self.persistence_mode_var.get()
+        self.app.config['persistence_decay'] = self.persistence_decay_var.get()
+        self.app.phosphor.mode = self.persistence_mode_var.get()
+        self.app.phosphor.decay = self.persistence_decay_var.get()
+        self.app.phosphor.reset()
         self.app.config['math_operation'] = self.math_op_var.get()
         self.app.config['show_reference'] = self.show_ref_var.get()
         self.app.config['trigger_mode'] = self.trigger_mode_var.get()
+        self.app.config['trigger_sweep'] = self.trigger_sweep_var.get()
+        self.app.config['trigger_hysteresis'] = self.trigger_hysteresis_var.get()
+        self.app.config['trigger_level_high'] = self.trigger_level_high_var.get()
+        self.app.config['pulse_condition'] = self.pulse_condition_var.get()
+        self.app.config['pulse_width_us'] = self.pulse_width_var.get()
+        self.app.config['trigger_holdoff_ms'] = self.holdoff_var.get()
         self.app.config['export_format'] = self.export_format_var.get()
+        self.app.config['frame_drop_policy'] = self.drop_policy_var.get()
+        self.app.frame_queue.policy = self.drop_policy_var.get()
+        self.app.config['record_length'] = self.record_length_var.get()
+        self.app.config['frame_delay_ms'] = self.frame_delay_var.get()
+        self.app.send_command(CMD_SET_RECORD_LENGTH, struct.pack('<H', self.record_length_var.get()))
+        self.app.send_command(CMD_SET_FRAME_DELAY, struct.pack('<H', self.frame_delay_var.get()))
+        self.app.config['adc_mode'] = self.adc_mode_var.get()
+        self.app.send_command(CMD_SET_ADC_MODE, bytes([ADC_MODES.index(self.adc_mode_var.get())]))
+        self.app.config['ets_enabled'] = self.ets_enabled_var.get()
+        self.app.config['ets_factor'] = self.ets_factor_var.get()
+        self.app.config['segment_count'] = self.segment_count_var.get()
+        self.app.config['roll_auto'] = self.roll_auto_var.get()
+        self.app.config['roll_threshold'] = self.roll_threshold_var.get()
+        self.app.config['stream_mode'] = self.stream_mode_var.get()
+        self.app.send_command(CMD_SET_STREAM, bytes([self.stream_mode_var.get()]))
+        self.app.config['wave_encoding'] = self.wave_encoding_var.get()
+        self.app.send_command(CMD_SET_ENCODING, bytes([self.app.desired_encoding()]))
+        self.app.config['flow_control'] = self.flow_control_var.get()
+        self.app.config['credit_window'] = self.credit_window_var.get()
+        self.app.send_flow_control()
+        self.app.ets_sampler.set_factor(self.ets_factor_var.get())
+        self.app.send_trigger_config()
+        self.app.update_software_trigger()
 
         # 应用主题
         bg = 'white' if self.theme_var.get() == 'light' else 'black'
@@ -146,7 +1323,15 @@ class UltimateOscilloscopeFinal:
         self.SAMPLES_PER_CHAN = 200
         self.TOTAL_SAMPLES = 600
         self.WAVE_DATA_SIZE = 1200
+        self.active_channels = [0, 1, 2]   # 设备实际发送的通道 (由配置帧协商, 采集线程使用)
+        self.display_channels = [0, 1, 2]  # GUI 线程: 当前显示帧携带的通道列表
+        self.bad_wave_frames = 0           # 负载长度与布局不符而丢弃的波形帧
         self.CTRL_DATA_SIZE = 16
+        # 单次批量读取: 约 50ms 的串口数据量 (10 bit/字节); 读超时取传完一整块的时间,
+        # 链路满载时每次读取都凑满一块, 空闲时线程每个超时醒来一次
+        self.READ_CHUNK_SIZE = max(64, int(self.BAUD_RATE / 10 * 0.05))
+        self.READ_TIMEOUT = self.READ_CHUNK_SIZE * 10 / self.BAUD_RATE
+        self.ADC_SCALE = 5.0 / 1023.0
         # 状态
         self.is_running = False
         self.time_base = 1.0        # 超宽时基范围（由硬件A3控制）
@@ -182,20 +1367,38 @@ class UltimateOscilloscopeFinal:
             'rise_time': [0.0, 0.0, 0.0]
         }
         # 数据
-        self.current_data = [[0.0] * self.SAMPLES_PER_CHAN for _ in range(3)]
+        self.current_data = np.zeros((3, self.SAMPLES_PER_CHAN), dtype=np.float32)
         self.history = []
         self.last_buttons = [0] * 10
         self.reference_waveform = None
         # 串口
         self.serial_port = None
-        self.serial_buffer = bytearray()
-        self.serial_lock = threading.Lock()
+        self.SERIAL_RING_SIZE = 65536
+        self.serial_ring = SerialRingBuffer(self.SERIAL_RING_SIZE)
+        self.write_lock = threading.Lock()  # GUI 线程命令与采集线程信用授权共用串口写
+        self.acq_thread = None
+        self.device_synced = False
+        # 压缩比统计: 实际波形负载字节 vs 等效 16 位字节
+        self.wave_payload_bytes = 0
+        self.wave_raw_bytes = 0
+        self.stop_event = threading.Event()
+        self.port_ready = threading.Event()
+        self.frame_parser = FrameParser({
+            b'\xAA\x55': (FRAME_WAVE, WAVE_RAW16, self.WAVE_DATA_SIZE),
+            b'\xCC\x33': (FRAME_CTRL, None, self.CTRL_DATA_SIZE),
+        })
+        self.delta_decoder = DeltaDecoder()
         # 性能
         self.last_update = time.time()
         self.fps = 0.0
-        self.sample_rate = 8000
+        self.DEFAULT_SAMPLE_RATE = 8000
+        self.sample_rate = self.DEFAULT_SAMPLE_RATE  # 每通道采样率, V3 固件由配置帧上报
+        self.sample_interval = 1.0 / self.sample_rate  # 当前帧的实测每通道采样间隔 (秒)
+        self.adc_mode = None
         # 配置
         self.config_file = "oscilloscope_config.json"
+        # 配置文件版本: 2 起 trigger_mode 才真正启用软件触发, 旧文件里默认保存的 'edge' 不代表用户选择
+        self.CONFIG_VERSION = 2
         # ========== 新增状态 ==========
         self.x_scale = 1.0
         self.acq_mode = "RUN"
@@ -211,12 +1414,63 @@ class UltimateOscilloscopeFinal:
             'font_size': 9,
             'math_operation': 'none',
             'show_reference': False,
-            'trigger_mode': 'edge',
-            'export_format': 'csv'
+            'trigger_mode': 'none',
+            'export_format': 'csv',
+            'frame_drop_policy': 'latest',
+            'frame_queue_size': 8,
+            'render_interval_ms': 16,
+            'record_length': 0,
+            'frame_delay_ms': 10,
+            'adc_mode': 'normal',
+            'hw_trigger': 'off',
+            'trigger_source': 0,
+            'trigger_position': 50,
+            'ets_enabled': False,
+            'ets_factor': 8,
+            'trigger_sweep': 'auto',
+            'trigger_hysteresis': 0.05,
+            'trigger_level_high': 3.5,
+            'pulse_condition': '>',
+            'pulse_width_us': 1000.0,
+            'trigger_holdoff_ms': 0.0,
+            'segment_count': 1000,
+            'roll_auto': False,
+            'roll_threshold': 0.2,
+            'stream_mode': False,
+            'flow_control': True,
+            'credit_window': 4,
+            'wave_encoding': WAVE_PACKED10,
+            'render_backend': 'canvas',
+            'persistence_mode': 'off',
+            'persistence_decay': 0.9
         }
         self.load_config()
+        self.frame_queue = FrameQueue(self.config['frame_queue_size'], self.config['frame_drop_policy'])
+        self.ets_sampler = EquivalentTimeSampler(self.config['ets_factor'], self.config['trigger_position'] / 100.0)
+        self.sw_trigger = SoftwareTrigger()
+        self.current_trigger_pos = None
+        self.segment_arena = None
+        self.segment_capture = False
+        self.roll_buffer = RollBuffer()
+        self.roll_active = False
+        self.device_streaming = False
+        self.device_overruns = 0          # 设备端 ADC 双缓冲溢出丢弃的帧数 (配置帧上报)
+        self._overrun_raw = None
+        self.stream_assembler = StreamAssembler()
+        self.credit_pacer = CreditPacer(self.config['credit_window'])
+        self.wave_encoding = self.config['wave_encoding']  # 设备实际使用的编码, 以收到的波形帧为准
+        self.plot_layout = None     # 保留模式渲染: (布局键, 持久图元), 见 build_plot_layer()
+        self.x_grid_cache = {}            # (样本数, 宽度, X缩放) -> 各样本的屏幕 x
+        self.wave_version = 0             # current_data 每更新一帧加 1, 用于抽取缓存
+        self.trace_decimator = PeakDecimator()
+        self.ref_decimator = PeakDecimator()
+        self.raster_renderer = RasterRenderer()
+        self.plot_photo = None
+        self.phosphor = PhosphorAccumulator(self.config['persistence_mode'], self.config['persistence_decay'])
         self.setup_ui()
+        self.update_software_trigger()
         self.start_serial_thread()
+        self.root.after(self.config['render_interval_ms'], self.render_tick)
         self.root.bind('<F11>', self.toggle_fullscreen)
         self.root.bind('<Escape>', self.exit_fullscreen)
 
@@ -234,6 +1488,8 @@ class UltimateOscilloscopeFinal:
                     self.x_scale = saved.get('x_scale', 1.0)
                     # 加载新设置
                     settings = saved.get('settings', {})
+                    if saved.get('config_version', 1) < 2:
+                        settings.pop('trigger_mode', None)
                     if settings:
                         self.config.update(settings)
                         # 应用主题
@@ -255,6 +1511,7 @@ class UltimateOscilloscopeFinal:
             'scan_fine': self.scan_fine,
             'dc_offset': self.dc_offset,
             'x_scale': self.x_scale,
+            'config_version': self.CONFIG_VERSION,
             'settings': self.config
         }
         try:
@@ -359,7 +1616,22 @@ class UltimateOscilloscopeFinal:
         trig_spin = ttk.Spinbox(trig_frame, from_=0, to=5, increment=0.1,
                                textvariable=self.trig_level_var, width=10)
         trig_spin.pack(fill=tk.X, padx=5, pady=2)
-        self.trig_level_var.trace('w', lambda *args: setattr(self, 'trigger_level', self.trig_level_var.get()))
+        self.trig_level_var.trace('w', lambda *args: self.set_trigger_level(self.trig_level_var.get()))
+        ttk.Label(trig_frame, text="硬件触发:").pack(anchor=tk.W, padx=5)
+        self.hw_trigger_var = tk.StringVar(value=self.config.get('hw_trigger', 'off'))
+        ttk.Combobox(trig_frame, textvariable=self.hw_trigger_var, values=list(HW_TRIGGER_MODES),
+                     state='readonly', width=10).pack(fill=tk.X, padx=5, pady=2)
+        ttk.Label(trig_frame, text="触发源:").pack(anchor=tk.W, padx=5)
+        self.trig_source_var = tk.StringVar(value=f"CH{self.config.get('trigger_source', 0) + 1}")
+        ttk.Combobox(trig_frame, textvariable=self.trig_source_var, values=['CH1', 'CH2', 'CH3'],
+                     state='readonly', width=10).pack(fill=tk.X, padx=5, pady=2)
+        ttk.Label(trig_frame, text="预触发 (%):").pack(anchor=tk.W, padx=5)
+        self.trig_position_var = tk.IntVar(value=self.config.get('trigger_position', 50))
+        ttk.Spinbox(trig_frame, from_=0, to=100, increment=10,
+                    textvariable=self.trig_position_var, width=10).pack(fill=tk.X, padx=5, pady=2)
+        self.hw_trigger_var.trace('w', lambda *args: self.on_trigger_settings_changed())
+        self.trig_source_var.trace('w', lambda *args: self.on_trigger_settings_changed())
+        self.trig_position_var.trace('w', lambda *args: self.on_trigger_settings_changed())
 
         for i in range(3):
             ch_frame = ttk.LabelFrame(control_frame, text=f"通道 {i+1} (A{i})")
@@ -367,6 +1639,7 @@ class UltimateOscilloscopeFinal:
             enable_var = tk.BooleanVar(value=True)
             enable_cb = ttk.Checkbutton(ch_frame, text="启用", variable=enable_var)
             enable_cb.pack(anchor=tk.W, padx=5)
+            enable_var.trace('w', lambda *args: self.send_channel_mask())
             setattr(self, f'ch{i}_enabled', enable_var)
 
         xy_frame = ttk.LabelFrame(control_frame, text="XY模式设置")
@@ -395,6 +1668,9 @@ class UltimateOscilloscopeFinal:
         # ========== 新增按钮 ==========
         ttk.Button(btn_frame2, text="暂停", command=self.pause_acquisition).pack(fill=tk.X, pady=2)
         ttk.Button(btn_frame2, text="抓取波形 (Single)", command=self.single_acquisition).pack(fill=tk.X, pady=2)
+        self.segment_btn = ttk.Button(btn_frame2, text="分段采集", command=self.toggle_segment_capture)
+        self.segment_btn.pack(fill=tk.X, pady=2)
+        ttk.Button(btn_frame2, text="分段浏览", command=self.show_segments).pack(fill=tk.X, pady=2)
 
         right_frame = ttk.Frame(main_frame)
         right_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
@@ -465,7 +1741,9 @@ class UltimateOscilloscopeFinal:
             if port == "未找到设备":
                 messagebox.showwarning("警告", "未找到串口设备！")
                 return
-            self.serial_port = serial.Serial(port, self.BAUD_RATE, timeout=0.01)
+            self.serial_port = serial.Serial(port, self.BAUD_RATE, timeout=self.READ_TIMEOUT)
+            # 采集状态由采集线程在发现新端口时自行复位 (reset_acquisition)
+            self.port_ready.set()
             self.status_var.set(f"✅ 已连接: {port} | 终极示波器就绪")
         except Exception as e:
             error_msg = "端口被占用" if "PermissionError" in str(e) else str(e)
@@ -473,14 +1751,133 @@ class UltimateOscilloscopeFinal:
             self.serial_port = None
 
     def disconnect_serial(self):
-        if self.serial_port and self.serial_port.is_open:
-            self.serial_port.close()
+        self.port_ready.clear()
+        port = self.serial_port
+        if port and port.is_open:
+            # 唤醒阻塞中的读取, 再关闭
+            if hasattr(port, 'cancel_read'):
+                port.cancel_read()
+            port.close()
         self.serial_port = None
         self.status_var.set("❌ 已断开连接")
 
     def toggle_run(self):
         self.is_running = not self.is_running
         self.run_btn.config(text="停止采集" if self.is_running else "开始采集")
+        self.send_command(CMD_RUN_STOP, bytes([self.is_running]))
+
+    # ========== 设备命令 ==========
+    def send_command(self, cmd, payload=b''):
+        """向 V3 固件发送命令; 旧版固件不读串口, 直接忽略"""
+        port = self.serial_port
+        if not (port and port.is_open) or self.frame_parser.version != V3_VERSION:
+            return False
+        try:
+            with self.write_lock:
+                port.write(build_command(cmd, payload))
+            return True
+        except Exception as e:
+            print(f"命令发送失败: {e}")
+            return False
+
+    def desired_channel_mask(self):
+        return sum(1 << ch for ch in range(3) if getattr(self, f'ch{ch}_enabled').get())
+
+    def desired_adc_mode(self):
+        mode = self.config.get('adc_mode', 'normal')
+        return ADC_MODES.index(mode) if mode in ADC_MODES else 0
+
+    def desired_encoding(self):
+        encoding = self.config.get('wave_encoding', WAVE_PACKED10)
+        return WAVE_ENCODINGS.index(encoding) if encoding in WAVE_ENCODINGS else 1
+
+    def send_channel_mask(self):
+        mask = self.desired_channel_mask()
+        if mask:
+            self.send_command(CMD_SET_CHANNEL_MASK, bytes([mask]))
+
+    # ========== 硬件触发 ==========
+    def hw_trigger_mode(self):
+        mode = self.config.get('hw_trigger', 'off')
+        return mode if mode in HW_TRIGGER_MODES else 'off'
+
+    def hw_trigger_active(self):
+        """设备端正在做边沿触发 (仅 V3 固件)"""
+        return self.frame_parser.version == V3_VERSION and self.hw_trigger_mode() != 'off'
+
+    def send_trigger_config(self):
+        src = self.config.get('trigger_source', 0)
+        # 电平按触发源的零点偏移换算回 ADC 计数
+        counts = int(round((self.trigger_level + self.dc_offset[src]) / self.ADC_SCALE))
+        counts = max(0, min(1023, counts))
+        payload = struct.pack('<BBBHBB', HW_TRIGGER_MODES.index(self.hw_trigger_mode()), src,
+                              0 if self.trigger_rising else 1, counts,
+                              max(0, min(100, self.config.get('trigger_position', 50))),
+                              TRIG_FLAG_DITHER if self.config.get('ets_enabled') else 0)
+        self.send_command(CMD_SET_TRIGGER, payload)
+
+    def set_trigger_level(self, level):
+        self.trigger_level = level
+        self.send_trigger_config()
+        self.update_software_trigger()
+
+    def update_software_trigger(self):
+        """把触发设置同步到采集线程的软件触发引擎"""
+        trig = self.sw_trigger
+        mode = self.config.get('trigger_mode', 'none')
+        trig.mode = mode if mode in SoftwareTrigger.MODES else 'none'
+        trig.sweep = self.config.get('trigger_sweep', 'auto')
+        trig.source = self.config.get('trigger_source', 0)
+        trig.level = self.trigger_level
+        trig.level_high = self.config.get('trigger_level_high', 3.5)
+        trig.rising = self.trigger_rising
+        trig.hysteresis = self.config.get('trigger_hysteresis', 0.05)
+        trig.pulse_condition = self.config.get('pulse_condition', '>')
+        trig.pulse_width = self.config.get('pulse_width_us', 1000.0) * 1e-6
+        trig.holdoff = self.config.get('trigger_holdoff_ms', 0.0) * 1e-3
+        trig.position = self.config.get('trigger_position', 50) / 100.0
+        if trig.position != self.ets_sampler.position:
+            self.ets_sampler.set_factor(self.ets_sampler.factor, trig.position)
+
+    def on_trigger_settings_changed(self):
+        try:
+            self.config['hw_trigger'] = self.hw_trigger_var.get()
+            self.config['trigger_source'] = int(self.trig_source_var.get()[2:]) - 1
+            self.config['trigger_position'] = self.trig_position_var.get()
+        except (tk.TclError, ValueError):
+            return
+        self.ets_sampler.reset()
+        self.send_trigger_config()
+        self.update_software_trigger()
+
+    def send_flow_control(self):
+        """开启时由 grant_credits() 在收到帧后授权; 关闭时让设备恢复固定帧间隔"""
+        self.credit_pacer.window = self.config.get('credit_window', 4)
+        self.credit_pacer.reset()
+        if not self.config.get('flow_control', True):
+            self.send_command(CMD_SET_CREDITS)
+
+    def grant_credits(self):
+        """采集线程: 按已收到的帧序号与 GUI 积压推进设备的发送上限"""
+        if not (self.device_synced and self.config.get('flow_control', True)):
+            return
+        # 两种队列策略都扣除 GUI 积压: latest 策略下积压的帧终将被丢弃, 不必再发
+        limit = self.credit_pacer.update(self.frame_parser.last_seq, self.frame_queue.backlog())
+        if limit is not None:
+            self.send_command(CMD_SET_CREDITS, struct.pack('<H', limit))
+
+    def sync_device_config(self):
+        """把界面状态整体下发给设备 (连接后首个配置帧时调用)"""
+        self.send_channel_mask()
+        self.send_command(CMD_SET_RECORD_LENGTH, struct.pack('<H', self.config.get('record_length', 0)))
+        self.send_command(CMD_SET_FRAME_DELAY, struct.pack('<H', self.config.get('frame_delay_ms', 10)))
+        self.send_command(CMD_SET_ADC_MODE, bytes([self.desired_adc_mode()]))
+        self.send_command(CMD_SET_ENCODING, bytes([self.desired_encoding()]))
+        self.send_trigger_config()
+        self.send_command(CMD_SET_STREAM, bytes([bool(self.config.get('stream_mode'))]))
+        self.send_flow_control()
+        self.send_command(CMD_RUN_STOP, bytes([self.is_running]))
+        self.device_synced = True
 
     def toggle_cursor(self):
         self.cursor_mode = not self.cursor_mode
@@ -543,73 +1940,267 @@ class UltimateOscilloscopeFinal:
 
     # ========== 串口线程 ==========
     def serial_reader(self):
-        while True:
+        """采集线程: 按块阻塞读取, 由串口超时/关闭事件唤醒, 空闲时不占用 CPU
+
+        环形缓冲区、解析器与各采集状态只由本线程访问, 读取与解析都无需加锁;
+        GUI 线程连接新端口后, 本线程在首次读取前自行复位这些状态。
+        """
+        current = None
+        while not self.stop_event.is_set():
+            if not self.port_ready.wait(0.5):
+                continue
             try:
-                if self.serial_port and self.serial_port.is_open:
-                    if self.serial_port.in_waiting:
-                        with self.serial_lock:
-                            raw_data = self.serial_port.read(self.serial_port.in_waiting)
-                            self.serial_buffer.extend(raw_data)
-                        self.root.after(0, self.process_serial_data)
-                time.sleep(0.001)
+                port = self.serial_port
+                if port is None or not port.is_open:
+                    continue
+                if port is not current:
+                    self.reset_acquisition()
+                    current = port
+                # 一次 readinto 直接读入环形缓冲区: 凑满一块或读超时返回
+                if self.serial_ring.readinto_from(port, self.READ_CHUNK_SIZE):
+                    self.publish_frames(self.process_serial_data())
             except Exception as e:
-                time.sleep(0.1)
+                if self.port_ready.is_set():
+                    print(f"串口读取错误: {e}")
+                    self.stop_event.wait(0.1)
+
+    def reset_acquisition(self):
+        """采集线程: 新连接开始时清空缓冲区并复位解析与采集状态"""
+        self.serial_ring.clear()
+        self.frame_parser.reset()
+        self.wave_encoding = self.config.get('wave_encoding', WAVE_PACKED10)
+        self.apply_device_layout(200, [0, 1, 2])
+        self.ets_sampler.reset()
+        self.sw_trigger.reset()
+        self.sample_rate = self.DEFAULT_SAMPLE_RATE
+        self.adc_mode = None
+        self.device_streaming = False
+        self.device_overruns = 0
+        self._overrun_raw = None
+        self.stream_assembler.reset()
+        self.credit_pacer.reset()
+        self.device_synced = False
 
     def start_serial_thread(self):
-        thread = threading.Thread(target=self.serial_reader, daemon=True)
-        thread.start()
+        self.acq_thread = threading.Thread(target=self.serial_reader, daemon=True)
+        self.acq_thread.start()
 
     def process_serial_data(self):
-        if not self.serial_lock.acquire(blocking=False):
-            return
+        """采集线程: 解析环形缓冲区中的完整帧, 返回待交给 GUI 的 [(类型, 帧)]"""
+        frames = []
         try:
-            HEADER_WAVE = b'\xAA\x55'
-            HEADER_CTRL = b'\xCC\x33'
-            while len(self.serial_buffer) >= 2:
-                idx = self.serial_buffer.find(HEADER_WAVE)
-                if idx == -1:
-                    break
-                if len(self.serial_buffer) < idx + 2 + self.WAVE_DATA_SIZE:
-                    break
-                frame = self.serial_buffer[idx+2:idx+2+self.WAVE_DATA_SIZE]
-                self.serial_buffer = self.serial_buffer[idx+2+self.WAVE_DATA_SIZE:]
-                if len(frame) == self.WAVE_DATA_SIZE:
-                    self.parse_waveform_frame(frame)
-            while len(self.serial_buffer) >= 2:
-                idx = self.serial_buffer.find(HEADER_CTRL)
-                if idx == -1:
-                    break
-                if len(self.serial_buffer) < idx + 2 + self.CTRL_DATA_SIZE:
-                    break
-                frame = self.serial_buffer[idx+2:idx+2+self.CTRL_DATA_SIZE]
-                self.serial_buffer = self.serial_buffer[idx+2+self.CTRL_DATA_SIZE:]
-                if len(frame) == self.CTRL_DATA_SIZE:
-                    self.parse_control_frame(frame)
+            for kind, encoding, payload in self.frame_parser.parse(self.serial_ring):
+                if kind == FRAME_WAVE:
+                    if encoding != self.wave_encoding:
+                        self.wave_encoding = encoding
+                        self.update_credit_frame_size()
+                    # 压缩比只计样本部分, 不计 V3 时间戳
+                    stamp = V3_WAVE_STAMP_SIZE if self.frame_parser.version == V3_VERSION else 0
+                    self.wave_payload_bytes += len(payload) - stamp
+                    self.wave_raw_bytes += self.TOTAL_SAMPLES * 2
+                    frame = self.decode_wave_payload(payload, encoding)
+                    if frame is not None:
+                        frame = self.trigger_wave_frame(frame)
+                    if frame is None:
+                        continue
+                elif kind == FRAME_INFO:
+                    frame = self.parse_info_frame(payload)
+                    if frame is None:
+                        continue
+                else:
+                    frame = bytes(payload)
+                frames.append((kind, frame))
         except Exception as e:
             print(f"数据处理错误: {e}")
-        finally:
-            self.serial_lock.release()
+        return frames
+
+    def publish_frames(self, frames):
+        """采集线程: 交给 GUI; keep_all 队列满时在此等待"""
+        for kind, frame in frames:
+            self.frame_queue.put(kind, frame)
+        self.grant_credits()
 
-    def parse_waveform_frame(self, data):
+    def parse_info_frame(self, data):
+        """采集线程: 按设备上报的记录长度与通道列表调整解码布局
+
+        返回 (每通道样本数, 通道列表, ADC模式, 每通道采样率, 流模式);
+        旧版 3 字节配置帧 ADC模式与采样率为 None; 附带的采集溢出计数累计到 device_overruns
+        """
         try:
-            for i in range(self.SAMPLES_PER_CHAN):
-                for ch in range(3):
-                    idx = (i * 3 + ch) * 2
-                    if idx + 1 < len(data):
-                        adc_val = data[idx] + (data[idx+1] << 8)
-                        voltage = adc_val * 5.0 / 1023.0
-                        self.current_data[ch][i] = min(5.0, max(0.0, voltage - self.dc_offset[ch]))
-            if len(self.history) >= 10:
-                self.history.pop(0)
-            self.history.append([row[:] for row in self.current_data])
-            if self.is_running:
-                current_time = time.time()
-                if current_time - self.last_update > 0.016:
-                    self.update_all_displays()
-                    self.last_update = current_time
-                    self.fps = 0.9 * self.fps + 0.1 * (1.0 / (current_time - self.last_update + 0.001))
+            samples_per_chan = data[0] | (data[1] << 8)
+            channels = [ch for ch in range(3) if data[2] & (1 << ch)]
+            total = samples_per_chan * len(channels)
+            if not channels or total == 0 or total * 2 > self.frame_parser.max_payload:
+                return None
+            adc_mode = sample_rate = None
+            if len(data) >= 8:
+                adc_mode = data[3]
+                sample_rate = struct.unpack_from('<I', data, 4)[0] or None
+            streaming = len(data) >= 9 and bool(data[8] & V3_INFO_FLAG_STREAM)
+            if streaming != self.device_streaming:
+                self.stream_assembler.reset()
+            self.device_streaming = streaming
+            if len(data) >= 11:
+                # 设备计数为 16 位回绕值, 按增量累计; 计数回退 (设备复位) 时从新值重新累计
+                raw = struct.unpack_from('<H', data, 9)[0]
+                delta = raw if self._overrun_raw is None else (raw - self._overrun_raw) & 0xFFFF
+                self.device_overruns += raw if delta >= 0x8000 else delta
+                self._overrun_raw = raw
+            self.apply_device_layout(samples_per_chan, channels)
+            return (samples_per_chan, channels, adc_mode, sample_rate, streaming)
+        except Exception as e:
+            print(f"配置解析错误: {e}")
+            return None
+
+    def apply_device_layout(self, samples_per_chan, channels):
+        if (samples_per_chan, list(channels)) != (self.SAMPLES_PER_CHAN, self.active_channels):
+            self.ets_sampler.reset()
+        self.SAMPLES_PER_CHAN = samples_per_chan
+        self.active_channels = list(channels)
+        self.TOTAL_SAMPLES = samples_per_chan * len(channels)
+        self.update_credit_frame_size()
+
+    def update_credit_frame_size(self):
+        """按当前布局与设备实际使用的编码估算一帧占用的接收缓冲区"""
+        payload = wave_payload_size(self.TOTAL_SAMPLES, self.wave_encoding)
+        self.credit_pacer.frame_bytes = 2 + V3_META_SIZE + V3_WAVE_STAMP_SIZE + payload + 2
+
+    def trigger_wave_frame(self, frame):
+        """采集线程: 软件触发与等效时间采样, 只有应当显示的帧才交给 GUI"""
+        timeline = frame.data
+        if frame.sample_index is not None:
+            timeline = self.stream_assembler.feed(frame)
+        if self.roll_active:
+            # 滚动模式不做触发, 按到达顺序 (流模式按行序号) 接入长记录
+            self.roll_buffer.append(timeline, frame.sample_interval or 1.0 / self.sample_rate)
+            return frame
+        ets = self.config.get('ets_enabled')
+        trig = self.sw_trigger
+        # 只有设备端触发开启时帧内的触发行才可信; 否则丢弃, 由软件触发 (如开启) 重新求出
+        hw_triggered = frame.trigger_pos is not None and self.hw_trigger_active()
+        if frame.trigger_pos is not None and not hw_triggered:
+            frame.trigger_pos = None
+        # 设备已按边沿触发对齐的帧无需再做软件边沿触发
+        if trig.mode != 'none' and not (trig.mode == 'edge' and hw_triggered):
+            interval = frame.sample_interval or 1.0 / self.sample_rate
+            frame = trig.process(frame, interval, align=not ets)
+            if frame is None:
+                return None
+        if ets:
+            frame = self.ets_sampler.add(frame)
+        if self.segment_capture and not self.segment_arena.append(frame):
+            self.segment_capture = False
+        # 余辉按采集帧率累加, 不受显示帧率限制
+        self.phosphor.add(frame.data)
+        return frame
+
+    def decode_wave_payload(self, payload, encoding):
+        """采集线程: 拆出 V3 时间戳并解码样本, 返回 WaveFrame"""
+        interval = start_us = trigger_pos = seq = sample_index = None
+        # 本帧按此刻协商的布局解码, 布局随帧一起交给 GUI
+        samples_per_chan, channels = self.SAMPLES_PER_CHAN, self.active_channels
+        if self.frame_parser.version == V3_VERSION:
+            seq = self.frame_parser.last_seq
+            if len(payload) < V3_WAVE_STAMP_SIZE:
+                return None
+            start_us, end_us, trig_row, trig_phase, row = struct.unpack_from('<IIHHI', payload)
+            interval = stamp_sample_interval(start_us, end_us, samples_per_chan, len(channels),
+                                             len(channels) + self.device_streaming)
+            if trig_row != V3_TRIG_ROW_NONE:
+                trigger_pos = trig_row - 1 + trig_phase / 65536.0
+            if row != V3_STREAM_ROW_NONE:
+                sample_index = row
+            payload = payload[V3_WAVE_STAMP_SIZE:]
+        data = self.parse_waveform_frame(payload, encoding, samples_per_chan, channels)
+        if data is None:
+            return None
+        return WaveFrame(data, interval, start_us, trigger_pos, seq, sample_index, channels)
+
+    def parse_waveform_frame(self, data, encoding, samples_per_chan, channels):
+        try:
+            total = samples_per_chan * len(channels)
+            # 负载长度与协商布局不符 (配置帧与波形帧交错、链路损坏) 的帧直接丢弃
+            if encoding == WAVE_DELTA:
+                valid = len(data) >= total // 4
+            else:
+                valid = len(data) == wave_payload_size(total, encoding)
+            if not valid:
+                self.bad_wave_frames += 1
+                return None
+            if encoding == WAVE_PACKED10:
+                raw = unpack_packed10(data, total)
+            elif encoding == WAVE_DELTA:
+                raw = self.delta_decoder.decode(data, total, len(channels))
+            else:
+                raw = np.frombuffer(data, dtype='<u2', count=total)
+            # 解码进 GUI 归还的缓冲区; 帧交给 GUI 后归其所有, 用完 (被队列丢弃或移出历史) 才回到空闲表
+            out = self.frame_queue.buffer((3, samples_per_chan))
+            return samples_to_volts(raw, samples_per_chan, channels, self.ADC_SCALE, self.dc_offset, out)
         except Exception as e:
             print(f"波形解析错误: {e}")
+            return None
+
+    # ========== GUI 渲染节拍 ==========
+    def render_tick(self):
+        """GUI 线程: 按固定节拍取出采集线程交付的帧并刷新显示"""
+        try:
+            self.update_roll_mode()
+            new_wave = False
+            for kind, frame in self.frame_queue.drain():
+                if kind == FRAME_WAVE:
+                    self.on_waveform_frame(frame)
+                    new_wave = True
+                elif kind == FRAME_INFO:
+                    samples_per_chan, channels, adc_mode, sample_rate, streaming = frame
+                    if sample_rate:
+                        self.sample_rate = sample_rate
+                    self.adc_mode = adc_mode
+                    names = ', '.join(f"CH{ch+1}" for ch in channels)
+                    status = f"设备配置: {samples_per_chan} 样本/通道 | 通道: {names} | 采样率: {self.sample_rate} Hz"
+                    if adc_mode is not None and adc_mode < len(ADC_MODES):
+                        status += f" | ADC: {ADC_MODES[adc_mode]}"
+                    if streaming:
+                        status += " | 无间隙流"
+                    self.status_var.set(status)
+                    mask = sum(1 << ch for ch in channels)
+                    desired = self.desired_channel_mask()
+                    mode_changed = adc_mode is not None and (adc_mode != self.desired_adc_mode() or
+                                                             streaming != bool(self.config.get('stream_mode')))
+                    if not self.device_synced or (desired and mask != desired) or mode_changed:
+                        self.sync_device_config()
+                else:
+                    self.parse_control_frame(frame)
+            if new_wave and self.is_running:
+                current_time = time.time()
+                self.update_all_displays()
+                self.fps = 0.9 * self.fps + 0.1 * (1.0 / (current_time - self.last_update + 0.001))
+                self.last_update = current_time
+        except Exception as e:
+            print(f"渲染错误: {e}")
+        finally:
+            self.root.after(self.config['render_interval_ms'], self.render_tick)
+
+    def update_roll_mode(self):
+        """时基超过阈值 (s/div) 时自动切换到滚动模式"""
+        active = bool(self.config.get('roll_auto', False)) and self.time_base >= self.config.get('roll_threshold', 0.2)
+        if active and not self.roll_active:
+            self.roll_buffer.reset()
+        self.roll_active = active
+
+    def on_waveform_frame(self, frame):
+        data = frame.data
+        if data.shape != self.current_data.shape:
+            self.current_data = np.empty_like(data)
+        np.copyto(self.current_data, data)
+        self.wave_version += 1
+        # 有时间戳时使用实测间隔, 否则退回配置帧上报 (或默认) 的采样率
+        self.sample_interval = frame.sample_interval or 1.0 / self.sample_rate
+        self.current_trigger_pos = frame.trigger_pos
+        if frame.channels is not None:
+            self.display_channels = frame.channels
+        if len(self.history) >= 10:
+            self.frame_queue.recycle(self.history.pop(0).data)
+        self.history.append(frame)
 
     def parse_control_frame(self, data):
         try:
@@ -654,6 +2245,8 @@ class UltimateOscilloscopeFinal:
                 self.toggle_run()
             elif btn == 1:  # D3: Trigger Slope
                 self.trigger_rising = not self.trigger_rising
+                self.send_trigger_config()
+                self.update_software_trigger()
             elif btn == 2:  # D4: Channel Select
                 self.cycle_channels()
             elif btn == 3:  # D5: Trigger Level +
@@ -673,6 +2266,10 @@ class UltimateOscilloscopeFinal:
             elif btn == 9:  # D11: Auto Zero
                 self.auto_zero()
 
+    def channel_active(self, ch):
+        """通道在界面上启用且设备实际在发送 (以最近一帧携带的通道列表为准)"""
+        return getattr(self, f'ch{ch}_enabled').get() and ch in self.display_channels
+
     def cycle_channels(self):
         enabled = [i for i in range(3) if getattr(self, f'ch{i}_enabled').get()]
         if len(enabled) == 3:
@@ -691,9 +2288,9 @@ class UltimateOscilloscopeFinal:
         if not self.is_running:
             return
         for i in range(3):
-            if getattr(self, f'ch{i}_enabled').get():
+            if self.channel_active(i):
                 data = self.current_data[i]
-                vpp = max(data) - min(data)
+                vpp = float(data.max() - data.min())
                 if vpp > 0.1:
                     volt_div = max(0.001, vpp / 4.0)
                     self.volt_base_var.set(volt_div)
@@ -705,9 +2302,9 @@ class UltimateOscilloscopeFinal:
             messagebox.showwarning("警告", "请先开始采集！")
             return
         for ch in range(3):
-            if getattr(self, f'ch{ch}_enabled').get():
+            if self.channel_active(ch):
                 data = self.current_data[ch]
-                dc_avg = sum(data) / len(data)
+                dc_avg = float(data.mean())
                 self.dc_offset[ch] = dc_avg
                 print(f"通道 {ch+1} DC偏移校准: {dc_avg:.4f}V")
         self.save_config()
@@ -716,12 +2313,12 @@ class UltimateOscilloscopeFinal:
     # ========== 频率/电压计算 ==========
     def calculate_frequency_voltage(self):
         for ch in range(3):
-            if getattr(self, f'ch{ch}_enabled').get():
+            if self.channel_active(ch):
                 data = self.current_data[ch]
                 n = len(data)
                 if n > 0:
-                    self.channel_voltages[ch] = data[-1]
-                    avg_voltage = sum(data) / n
+                    self.channel_voltages[ch] = float(data[-1])
+                    avg_voltage = float(data.mean())
                     self.average_voltages[ch] = avg_voltage
                     freq = self.calculate_frequency(data)
                     self.channel_frequencies[ch] = freq
@@ -744,34 +2341,30 @@ class UltimateOscilloscopeFinal:
     def calculate_frequency(self, data):
         if len(data) < 2:
             return 0.0
-        mean_val = sum(data) / len(data)
-        crossings = []
-        for i in range(1, len(data)):
-            if (data[i-1] < mean_val and data[i] >= mean_val) or \
-               (data[i-1] > mean_val and data[i] <= mean_val):
-                crossings.append(i)
+        data = np.asarray(data)
+        mean_val = data.mean()
+        prev, cur = data[:-1], data[1:]
+        crossings = np.flatnonzero(((prev < mean_val) & (cur >= mean_val)) |
+                                   ((prev > mean_val) & (cur <= mean_val))) + 1
         if len(crossings) < 2:
             return 0.0
-        periods = []
-        for i in range(1, len(crossings)):
-            periods.append(crossings[i] - crossings[i-1])
-        avg_period_samples = sum(periods) / len(periods) * 2
+        avg_period_samples = float(np.diff(crossings).mean()) * 2
         if avg_period_samples <= 0:
             return 0.0
-        return self.sample_rate / avg_period_samples
+        return 1.0 / (avg_period_samples * self.sample_interval)
 
     # ========== 自动测量 ==========
     def calculate_measurements(self):
         for ch in range(3):
-            if getattr(self, f'ch{ch}_enabled').get():
+            if self.channel_active(ch):
                 data = self.current_data[ch]
                 n = len(data)
                 if n > 0:
-                    vmax = max(data)
-                    vmin = min(data)
+                    vmax = float(data.max())
+                    vmin = float(data.min())
                     vpp = vmax - vmin
-                    vavg = sum(data) / n
-                    vrms = math.sqrt(sum(x*x for x in data) / n)
+                    vavg = float(data.mean())
+                    vrms = float(np.sqrt(np.mean(np.square(data, dtype=np.float64))))
                     frequency = self.calculate_frequency(data)
                     period = 1000.0 / frequency if frequency > 0 else 0
                     rise_time = self.calculate_rise_time(data)
@@ -790,22 +2383,18 @@ class UltimateOscilloscopeFinal:
     def calculate_rise_time(self, data):
         if len(data) < 2:
             return 0.0
-        vmin = min(data)
-        vmax = max(data)
+        data = np.asarray(data)
+        vmin = float(data.min())
+        vmax = float(data.max())
         vrange = vmax - vmin
         if vrange <= 0:
             return 0.0
         v10 = vmin + 0.1 * vrange
         v90 = vmin + 0.9 * vrange
-        t10 = t90 = -1
-        for i in range(len(data)):
-            if data[i] >= v10 and t10 == -1:
-                t10 = i
-            if data[i] >= v90 and t90 == -1:
-                t90 = i
-                break
-        if t10 != -1 and t90 != -1 and t90 > t10:
-            time_diff = (t90 - t10) / self.sample_rate
+        t10 = int(np.argmax(data >= v10))
+        t90 = int(np.argmax(data >= v90))
+        if t90 > t10:
+            time_diff = (t90 - t10) * self.sample_interval
             return time_diff * 1000000
         return 0.0
 
@@ -818,14 +2407,10 @@ class UltimateOscilloscopeFinal:
             self.update_status()
             return
         if self.acq_mode == "SINGLE" and not self.single_triggered:
-            ch0_data = self.current_data[0]
-            if len(ch0_data) > 10:
-                for i in range(1, len(ch0_data)):
-                    if ch0_data[i-1] < self.trigger_level <= ch0_data[i]:
-                        self.single_triggered = True
-                        self.acq_mode = "PAUSE"
-                        self.status_var.set("✅ 单次触发完成！")
-                        break
+            if self.single_trigger_found():
+                self.single_triggered = True
+                self.acq_mode = "PAUSE"
+                self.status_var.set("✅ 单次触发完成！")
 
         self.calculate_frequency_voltage()
         self.calculate_measurements()
@@ -837,11 +2422,128 @@ class UltimateOscilloscopeFinal:
         self.update_measurements_display()
         self.update_status()
 
+    def single_trigger_found(self):
+        # 设备触发或软件触发对齐过的帧都带有触发位置
+        if self.current_trigger_pos is not None:
+            return True
+        data = self.current_data[self.config.get('trigger_source', 0)]
+        if len(data) <= 10:
+            return False
+        prev, cur = data[:-1], data[1:]
+        if self.trigger_rising:
+            crossed = (prev < self.trigger_level) & (cur >= self.trigger_level)
+        else:
+            crossed = (prev > self.trigger_level) & (cur <= self.trigger_level)
+        return bool(crossed.any())
+
+    def build_plot_layer(self, canvas, width, height, grid_steps, colors, backend='canvas'):
+        """保留模式: 网格与坐标标签只在尺寸/显示设置变化时创建一次;
+        波形、参考、触发线、光标与标题都是持久图元, 每帧只更新坐标与文字
+
+        raster 后端把网格画进背景帧缓冲, 画布上只有一张图像与坐标/标题文字
+        """
+        canvas.delete("all")
+        y_min, y_max = -5.0, 10.0
+        y_range = y_max - y_min
+        raster = backend == 'raster'
+        items = {'time_labels': [], 'visible': {}, 'texts': {}, 'time_base': None}
+        if raster:
+            rgb = lambda color: tuple(c >> 8 for c in canvas.winfo_rgb(color))
+            items['rgb'] = {color: rgb(color) for color in set(colors) | {'green', 'red', 'white'}}
+            renderer = self.raster_renderer
+            renderer.reset(width, height, rgb(canvas.cget('bg')))
+            self.plot_photo = tk.PhotoImage(width=width, height=height)
+            items['image'] = canvas.create_image(0, 0, image=self.plot_photo, anchor='nw')
+            grid_rgb = rgb('#333333')
+        for i in range(grid_steps + 1):
+            x = (i / grid_steps) * width
+            if raster:
+                renderer.polyline((x, 0, x, height), grid_rgb, target=renderer.background)
+            else:
+                canvas.create_line(x, 0, x, height, fill='#333333')
+            if i % (grid_steps // 5) == 0:
+                label = canvas.create_text(x, height-15, text='', fill='white', font=('Arial', 8))
+                items['time_labels'].append((i, label))
+        for i in range(16):
+            y_val = y_min + i * 1.0
+            if y_min <= y_val <= y_max:
+                y = height - ((y_val - y_min) / y_range) * height
+                if raster:
+                    renderer.polyline((0, y, width, y), grid_rgb, target=renderer.background)
+                else:
+                    canvas.create_line(0, y, width, y, fill='#333333')
+                canvas.create_text(10, y, text=f"{y_val:.1f}", fill='white', font=('Arial', 8), anchor='w')
+        if not raster:
+            # 后创建的图元在上层: 参考 < 波形 < 触发线 < 光标 < 文字
+            items['ref'] = [canvas.create_line(0, 0, 0, 0, fill='green', dash=(3, 3), width=1, state='hidden')
+                            for _ in range(3)]
+            items['trace'] = [canvas.create_line(0, 0, 0, 0, fill=colors[ch], width=2, state='hidden')
+                              for ch in range(3)]
+            items['trig_level'] = canvas.create_line(0, 0, 0, 0, fill='red', dash=(4, 4), state='hidden')
+            items['trig_pos'] = canvas.create_line(0, 0, 0, 0, fill='red', dash=(4, 4), state='hidden')
+            items['cursor'] = [canvas.create_line(0, 0, 0, 0, fill='white', dash=(2, 2), state='hidden')
+                               for _ in range(2)]
+        items['dt'] = canvas.create_text(0, 20, text='', fill='white', state='hidden')
+        items['title'] = canvas.create_text(10, 10, text='', fill='cyan', anchor='nw')
+        self.plot_layout = ((backend, width, height, grid_steps, tuple(colors), canvas.cget('bg')), items)
+        return items
+
+    def place_item(self, canvas, items, item, coords):
+        """更新持久图元的坐标; coords 为 None 时隐藏, 只在可见性变化时才改 state"""
+        visible = items['visible']
+        if coords is None:
+            if visible.get(item):
+                canvas.itemconfigure(item, state='hidden')
+                visible[item] = False
+            return
+        canvas.coords(item, coords)
+        if not visible.get(item):
+            canvas.itemconfigure(item, state='normal')
+            visible[item] = True
+
+    def set_item_text(self, canvas, items, item, text):
+        if items['texts'].get(item) != text:
+            canvas.itemconfigure(item, text=text)
+            items['texts'][item] = text
+
+    def trace_x_grid(self, n, width):
+        """n 个样本的屏幕 x 坐标 (按 X缩放 以屏幕中心伸缩并限制在画布内), 按 (n, 宽度, X缩放) 缓存
+
+        波形与参考波形长度可能不同, 因此缓存多个网格; 同一网格始终返回同一数组, 抽取缓存据此判断
+        """
+        key = (n, width, self.x_scale)
+        xs = self.x_grid_cache.get(key)
+        if xs is None:
+            if len(self.x_grid_cache) >= 8:
+                self.x_grid_cache.clear()
+            normalized = np.arange(n) / max(n - 1, 1)
+            xs = np.clip((0.5 + (normalized - 0.5) * self.x_scale) * width, 0, width)
+            self.x_grid_cache[key] = xs
+        return xs
+
+    def screen_transform(self, data, width, height, xs=None, volt_per_div=None, y_min=-5.0, y_range=15.0):
+        """(通道, N) 电压一次映射为 (通道, 2N) 交织屏幕坐标 x0 y0 x1 y1 ...; 少于 2 个样本时返回 None
+
+        y = 高度 - ((电压 + Y移位) / 每格电压 - y_min) / y_range * 高度; xs 默认为缓存的时间轴网格
+        """
+        channels, n = data.shape
+        if n < 2:
+            return None
+        if xs is None:
+            xs = self.trace_x_grid(n, width)
+        if volt_per_div is None:
+            volt_per_div = self.volt_per_div[:channels]
+        gain = -height / y_range / np.asarray(volt_per_div, dtype=np.float64)[:, None]
+        out = np.empty((channels, n, 2))
+        out[:, :, 0] = xs
+        np.multiply(data + self.y_axis_position, gain, out=out[:, :, 1])
+        out[:, :, 1] += height * (1.0 + y_min / y_range)
+        return out.reshape(channels, 2 * n)
+
     def update_plot(self):
         """主波形显示 - 使用硬件控制的 time_base 和 volt_per_div + X轴缩放"""
         try:
             canvas = self.canvas
-            canvas.delete("all")
             width = canvas.winfo_width()
             height = canvas.winfo_height()
             if width < 100 or height < 100:
@@ -852,103 +2554,204 @@ class UltimateOscilloscopeFinal:
             y_min, y_max = -5.0, 10.0
             y_range = y_max - y_min
 
-            # 绘制网格
+            # 网格与持久图元: 后端、尺寸、网格密度、通道颜色或背景变化时才重建
+            persistence = self.phosphor.mode != 'off' and not self.roll_active
+            # 余辉图像只能由光栅后端合成
+            backend = 'raster' if persistence else self.config.get('render_backend', 'canvas')
             grid_steps = {'sparse': 5, 'normal': 10, 'dense': 20}[self.config.get('grid_density', 'normal')]
-            for i in range(grid_steps + 1):
-                x = (i / grid_steps) * width
-                canvas.create_line(x, 0, x, height, fill='#333333')
-                if i % (grid_steps // 5) == 0:
-                    time_val = i * actual_time_per_div / grid_steps
-                    time_label = self.format_time_unit(time_val)
-                    canvas.create_text(x, height-15, text=time_label, fill='white', font=('Arial', 8))
-            for i in range(16):
-                y_val = y_min + i * 1.0
-                if y_min <= y_val <= y_max:
-                    y = height - ((y_val - y_min) / y_range) * height
-                    canvas.create_line(0, y, width, y, fill='#333333')
-                    canvas.create_text(10, y, text=f"{y_val:.1f}", fill='white', font=('Arial', 8), anchor='w')
-
-            # 绘制波形
             colors = [self.config.get(f'color_ch{i}', ['cyan', 'yellow', 'magenta'][i]) for i in range(3)]
-            for ch in range(3):
-                if getattr(self, f'ch{ch}_enabled').get():
-                    points = []
-                    for i in range(self.SAMPLES_PER_CHAN):
-                        normalized_i = i / (self.SAMPLES_PER_CHAN - 1)
-                        scaled_i = 0.5 + (normalized_i - 0.5) * self.x_scale
-                        x = max(0, min(width, scaled_i * width))
-                        voltage_raw = self.current_data[ch][i] + self.y_axis_position
-                        voltage_in_divs = voltage_raw / self.volt_per_div[ch]
-                        voltage = voltage_in_divs
-                        y = height - ((voltage - y_min) / y_range) * height
-                        points.extend([x, y])
-                    if len(points) >= 4:
-                        canvas.create_line(points, fill=colors[ch], width=2)
-
-            # ========== 参考波形 ==========
-            if self.config.get('show_reference') and self.reference_waveform:
-                ref_color = 'green'
-                for ch in range(3):
-                    if getattr(self, f'ch{ch}_enabled').get():
-                        points = []
-                        for i in range(self.SAMPLES_PER_CHAN):
-                            normalized_i = i / (self.SAMPLES_PER_CHAN - 1)
-                            scaled_i = 0.5 + (normalized_i - 0.5) * self.x_scale
-                            x = max(0, min(width, scaled_i * width))
-                            voltage_raw = self.reference_waveform[ch][i] + self.y_axis_position
-                            voltage_in_divs = voltage_raw / self.volt_per_div[ch]
-                            y = height - ((voltage_in_divs - y_min) / y_range) * height
-                            points.extend([x, y])
-                        if len(points) >= 4:
-                            canvas.create_line(points, fill=ref_color, dash=(3, 3), width=1)
+            key = (backend, width, height, grid_steps, tuple(colors), canvas.cget('bg'))
+            if self.plot_layout is None or self.plot_layout[0] != key:
+                items = self.build_plot_layer(canvas, width, height, grid_steps, colors, backend)
+            else:
+                items = self.plot_layout[1]
+            if items['time_base'] != actual_time_per_div:
+                for i, label in items['time_labels']:
+                    canvas.itemconfigure(label, text=self.format_time_unit(i * actual_time_per_div / grid_steps))
+                items['time_base'] = actual_time_per_div
+
+            scene = self.plot_scene(width, height, y_min, y_range, total_time)
+            if persistence:
+                # 与 screen_transform 相同的映射, 交给采集线程累加
+                gains = [-height / y_range / self.volt_per_div[ch] for ch in range(3)]
+                offsets = [g * self.y_axis_position + height * (1.0 + y_min / y_range) for g in gains]
+                channels = [ch for ch in range(3) if self.channel_active(ch)]
+                self.phosphor.configure(width, height, self.x_scale, gains, offsets, channels)
+            if backend == 'raster':
+                self.render_raster_scene(items, scene, colors, persistence)
+            else:
+                self.render_canvas_scene(canvas, items, scene, colors)
 
-            # 触发线
-            trigger_voltage_in_divs = (self.trigger_level + self.y_axis_position) / self.volt_per_div[0]
-            trigger_y = height - ((trigger_voltage_in_divs - y_min) / y_range) * height
-            canvas.create_line(0, trigger_y, width, trigger_y, fill='red', dash=(4, 4))
-
-            # 光标
-            if self.cursor_t1 is not None:
-                x1 = (self.cursor_t1 / total_time) * width
-                canvas.create_line(x1, 0, x1, height, fill='white', dash=(2, 2))
-                if self.cursor_t2 is not None:
-                    x2 = (self.cursor_t2 / total_time) * width
-                    canvas.create_line(x2, 0, x2, height, fill='white', dash=(2, 2))
-                    dt = abs(self.cursor_t2 - self.cursor_t1)
-                    dt_label = self.format_time_unit(dt)
-                    canvas.create_text((x1 + x2) / 2, 20, text=f"ΔT={dt_label}", fill='white')
+            # 文字在两种后端下都是画布图元
+            dt_pos = None
+            if scene['dt'] is not None:
+                dt_pos, dt_text = scene['dt']
+                self.set_item_text(canvas, items, items['dt'], dt_text)
+            self.place_item(canvas, items, items['dt'], dt_pos)
 
             # 标题
             title = f"扫描: {self.format_time_unit(actual_time_per_div)}/div | 垂直: {self.volt_per_div[0]:.3f}V/div | X缩放: {self.x_scale:.1f}x"
-            canvas.create_text(10, 10, text=title, fill='cyan', anchor='nw')
+            if self.roll_active:
+                title += f" | 滚动: {self.format_time_unit(self.roll_buffer.total * (self.roll_buffer.interval or 0))} 已记录"
+            if self.device_streaming:
+                stream = self.stream_assembler
+                title += f" | 流: 丢失 {stream.lost_rows} 样本/{stream.loss_events} 次"
+            if persistence:
+                title += f" | 余辉: {self.phosphor.frames} 帧"
+            self.set_item_text(canvas, items, items['title'], title)
         except Exception as e:
             print(f"绘图错误: {e}")
 
+    def plot_scene(self, width, height, y_min, y_range, total_time):
+        """计算一帧的屏幕几何 (与渲染后端无关): 折线为交织坐标数组, 直线为 (x0, y0, x1, y1), 不显示为 None"""
+        scene = {'roll': [], 'trace': [None] * 3, 'ref': [None] * 3,
+                 'trig_level': None, 'trig_pos': None, 'cursor': [None, None], 'dt': None}
+        if self.roll_active:
+            scene['roll'] = self.roll_polylines(width, height, y_min, y_range, total_time)
+        else:
+            # 长记录先按像素列做 min/max 抽取, 之后的变换与绘制只与画布宽度有关
+            data = self.current_data
+            xs, data = self.trace_decimator.decimate(data, self.trace_x_grid(data.shape[1], width), width,
+                                                     self.wave_version)
+            coords = self.screen_transform(data, width, height, xs=xs, y_min=y_min, y_range=y_range)
+            if coords is not None:
+                scene['trace'] = [coords[ch] if self.channel_active(ch) else None for ch in range(3)]
+
+            # ========== 参考波形 ==========
+            if self.config.get('show_reference') and self.reference_waveform is not None:
+                data = self.reference_waveform
+                xs, data = self.ref_decimator.decimate(data, self.trace_x_grid(data.shape[1], width), width)
+                coords = self.screen_transform(data, width, height, xs=xs, y_min=y_min, y_range=y_range)
+                if coords is not None:
+                    scene['ref'] = [coords[ch] if self.channel_active(ch) else None for ch in range(3)]
+
+            # 触发线
+            trig_src = self.config.get('trigger_source', 0)
+            trigger_voltage_in_divs = (self.trigger_level + self.y_axis_position) / self.volt_per_div[trig_src]
+            trigger_y = height - ((trigger_voltage_in_divs - y_min) / y_range) * height
+            scene['trig_level'] = (0, trigger_y, width, trigger_y)
+            n = self.current_data.shape[1]
+            if self.current_trigger_pos is not None and n > 1:
+                # 触发点位置标记
+                trig_x = (0.5 + (self.current_trigger_pos / (n - 1) - 0.5) * self.x_scale) * width
+                scene['trig_pos'] = (trig_x, 0, trig_x, height)
+
+        # 光标
+        if self.cursor_t1 is not None:
+            x1 = (self.cursor_t1 / total_time) * width
+            scene['cursor'][0] = (x1, 0, x1, height)
+            if self.cursor_t2 is not None:
+                x2 = (self.cursor_t2 / total_time) * width
+                scene['cursor'][1] = (x2, 0, x2, height)
+                dt = abs(self.cursor_t2 - self.cursor_t1)
+                scene['dt'] = (((x1 + x2) / 2, 20), f"ΔT={self.format_time_unit(dt)}")
+        return scene
+
+    def render_canvas_scene(self, canvas, items, scene, colors):
+        """Tk 矢量后端: 更新持久图元的坐标, 滚动包络每帧重建"""
+        canvas.delete('roll')
+        for ch, run in scene['roll']:
+            canvas.create_line(run.ravel().tolist(), fill=colors[ch], tags='roll')
+        if scene['roll']:
+            canvas.tag_lower('roll', items['trace'][0])
+        for name in ('trace', 'ref'):
+            for item, coords in zip(items[name], scene[name]):
+                self.place_item(canvas, items, item, None if coords is None else coords.tolist())
+        self.place_item(canvas, items, items['trig_level'], scene['trig_level'])
+        self.place_item(canvas, items, items['trig_pos'], scene['trig_pos'])
+        for item, coords in zip(items['cursor'], scene['cursor']):
+            self.place_item(canvas, items, item, coords)
+
+    def render_raster_scene(self, items, scene, colors, persistence=False):
+        """光栅后端: 在帧缓冲中按矢量后端相同的层次与线型绘制, 整帧一次性交给 PhotoImage
+
+        余辉模式下以分级着色的命中直方图代替当前帧波形
+        """
+        renderer = self.raster_renderer
+        rgb = items['rgb']
+        renderer.begin()
+        if persistence:
+            self.phosphor.render(renderer.frame, [rgb[color] for color in colors])
+        for ch, run in scene['roll']:
+            renderer.polyline(run, rgb[colors[ch]])
+        for coords in scene['ref']:
+            if coords is not None:
+                renderer.polyline(coords, rgb['green'], dash=(3, 3))
+        for ch, coords in enumerate(scene['trace']):
+            if coords is not None and not persistence:
+                renderer.polyline(coords, rgb[colors[ch]], width=2)
+        for name in ('trig_level', 'trig_pos'):
+            if scene[name] is not None:
+                renderer.polyline(scene[name], rgb['red'], dash=(4, 4))
+        for coords in scene['cursor']:
+            if coords is not None:
+                renderer.polyline(coords, rgb['white'], dash=(2, 2))
+        self.plot_photo.configure(data=renderer.to_ppm(), format='PPM')
+
+    def roll_polylines(self, width, height, y_min, y_range, total_time):
+        """滚动模式: 每个像素列取该列时间段内的 min/max 包络, 最新数据在右端
+
+        返回 [(通道, (点数, 2) 坐标)]; 流模式丢失的列 (NaN) 处断开为多段
+        """
+        interval = self.roll_buffer.interval
+        if not interval:
+            return []
+        cols, lo, hi = self.roll_buffer.decimate(total_time / interval, width)
+        if len(cols) < 2:
+            return []
+        xs = np.repeat(cols.astype(np.float64), 2)
+        # 每列依次连接 min/max, 形成连续的包络折线
+        env = np.stack((lo, hi), axis=2).reshape(lo.shape[0], -1)
+        coords = self.screen_transform(env, width, height, xs=xs, y_min=y_min, y_range=y_range)
+        runs = []
+        for ch in range(3):
+            if self.channel_active(ch):
+                points = coords[ch].reshape(-1, 2)
+                valid = np.isfinite(points[:, 1])
+                if valid.all():
+                    runs.append((ch, points))
+                    continue
+                for run in np.split(points, np.flatnonzero(np.diff(valid)) + 1):
+                    if len(run) >= 2 and np.isfinite(run[0, 1]):
+                        runs.append((ch, run))
+        return runs
+
+    def build_xy_layer(self, canvas, key):
+        """XY 模式的持久图元: 轨迹与说明文字只创建一次, 每帧只更新坐标与文字 (与 build_plot_layer 共用 plot_layout)"""
+        canvas.delete("all")
+        items = {'visible': {}, 'texts': {},
+                 'trace': canvas.create_line(0, 0, 0, 0, fill='cyan', width=2, state='hidden'),
+                 'title': canvas.create_text(10, 10, text='', fill='cyan', anchor='nw', font=('Arial', 10))}
+        self.plot_layout = (key, items)
+        return items
+
     def update_xy_plot(self):
         try:
             canvas = self.canvas
-            canvas.delete("all")
             width = canvas.winfo_width()
             height = canvas.winfo_height()
             if width < 100 or height < 100:
                 return
+            key = ('xy', width, height, canvas.cget('bg'))
+            if self.plot_layout is None or self.plot_layout[0] != key:
+                items = self.build_xy_layer(canvas, key)
+            else:
+                items = self.plot_layout[1]
             x_data = self.current_data[self.xy_ch_x]
             y_data = self.current_data[self.xy_ch_y]
-            points = []
-            for i in range(min(len(x_data), len(y_data))):
-                x = ((x_data[i] + self.y_axis_position) / 15.0) * width
-                y = height - ((y_data[i] + self.y_axis_position) / 15.0) * height
-                points.extend([x, y])
-            if len(points) >= 4:
-                canvas.create_line(points, fill='cyan', width=2)
+            # 两轴都按 0..15V 满幅映射
+            xs = (x_data + self.y_axis_position) / 15.0 * width
+            coords = self.screen_transform(y_data[None, :], width, height, xs=xs, volt_per_div=(1.0,),
+                                           y_min=0.0, y_range=15.0)
+            self.place_item(canvas, items, items['trace'], None if coords is None else coords[0].tolist())
             x_freq = self.calculate_frequency(x_data)
             y_freq = self.calculate_frequency(y_data)
-            x_volt = sum(x_data) / len(x_data) if x_data else 0
-            y_volt = sum(y_data) / len(y_data) if y_data else 0
+            x_volt = float(x_data.mean()) if len(x_data) else 0
+            y_volt = float(y_data.mean()) if len(y_data) else 0
             xy_info = f"XY模式: {['CH1','CH2','CH3'][self.xy_ch_x]} vs {['CH1','CH2','CH3'][self.xy_ch_y]}\n"
             xy_info += f"X频率: {x_freq:.2f}Hz | X电压: {x_volt:.3f}V\n"
             xy_info += f"Y频率: {y_freq:.2f}Hz | Y电压: {y_volt:.3f}V"
-            canvas.create_text(10, 10, text=xy_info, fill='cyan', anchor='nw', font=('Arial', 10))
+            self.set_item_text(canvas, items, items['title'], xy_info)
         except Exception as e:
             print(f"XY绘图错误: {e}")
 
@@ -967,7 +2770,7 @@ class UltimateOscilloscopeFinal:
             self.freq_text.delete(1.0, tk.END)
             self.freq_text.insert(tk.END, "📊 实时 & 平均频率/电压:\n")
             for ch in range(3):
-                if getattr(self, f'ch{ch}_enabled').get():
+                if self.channel_active(ch):
                     real_freq = self.channel_frequencies[ch]
                     avg_freq = self.average_frequencies[ch]
                     real_volt = self.channel_voltages[ch]
@@ -987,7 +2790,7 @@ class UltimateOscilloscopeFinal:
             self.measure_text.delete(1.0, tk.END)
             self.measure_text.insert(tk.END, "📈 自动测量结果:\n")
             for ch in range(3):
-                if getattr(self, f'ch{ch}_enabled').get():
+                if self.channel_active(ch):
                     self.measure_text.insert(tk.END, f"■ 通道 {ch+1} (A{ch}):\n")
                     vpp = self.measurements['vpp'][ch]
                     vmax = self.measurements['vmax'][ch]
@@ -1021,7 +2824,26 @@ class UltimateOscilloscopeFinal:
         time_str = self.format_time_unit(actual_time_per_div)
         volt_str = f"{self.volt_per_div[0]:.3f}V/div"
         mode_str = {"RUN": "运行", "PAUSE": "暂停", "SINGLE": "单次"}[self.acq_mode]
-        self.status_var.set(f"[{mode_str}] 扫描: {time_str} | 垂直: {volt_str} | X缩放: {self.x_scale:.1f}x | FPS: {self.fps:.1f}")
+        parser = self.frame_parser
+        link_str = f"V{parser.version or '-'} 帧: {parser.frames_received} CRC错: {parser.crc_failures} " \
+                   f"序号缺口: {parser.seq_gaps} 重同步: {parser.resyncs}"
+        if self.wave_payload_bytes:
+            link_str += f" 压缩比: {self.wave_raw_bytes / self.wave_payload_bytes:.2f}x"
+        if self.bad_wave_frames:
+            link_str += f" 长度错误帧: {self.bad_wave_frames}"
+        if self.segment_arena is not None:
+            arena = self.segment_arena
+            link_str += f" 分段: {arena.count}/{arena.capacity}"
+            if not self.segment_capture:
+                self.segment_btn.config(text="分段采集")
+        if self.sw_trigger.mode != 'none':
+            link_str += f" 软触发: {self.sw_trigger.triggered}"
+        if self.config.get('ets_enabled'):
+            if self.ets_sampler.active:
+                link_str += f" 等效采样填充: {self.ets_sampler.fill_ratio * 100:.0f}%"
+            else:
+                link_str += " 等效采样未生效 (无触发时间戳)"
+        self.status_var.set(f"[{mode_str}] 扫描: {time_str} | 垂直: {volt_str} | X缩放: {self.x_scale:.1f}x | 采样率: {1.0 / self.sample_interval:.0f}Hz | FPS: {self.fps:.1f} | 丢帧: {self.frame_queue.dropped} | 采集溢出: {self.device_overruns} | 接收溢出: {self.serial_ring.overruns} | {link_str}")
 
     def show_xy(self):
         self.toggle_xy_mode()
@@ -1036,6 +2858,74 @@ class UltimateOscilloscopeFinal:
         canvas = tk.Canvas(hist_window, bg='black')
         canvas.pack(fill=tk.BOTH, expand=True)
 
+    # ========== 分段采集 ==========
+    def toggle_segment_capture(self):
+        if self.segment_capture:
+            self.segment_capture = False
+            self.segment_btn.config(text="分段采集")
+            return
+        try:
+            # 按当前显示帧的长度 (已含等效时间采样的倍数) 与通道分配
+            arena = SegmentArena(max(1, int(self.config.get('segment_count', 1000))), self.current_data.shape[1],
+                                 self.display_channels)
+        except MemoryError:
+            messagebox.showerror("错误", "分段存储分配失败, 请减小分段数！")
+            return
+        self.segment_arena = arena
+        self.segment_capture = True
+        self.segment_btn.config(text="停止分段采集")
+        self.status_var.set(f"🎞 分段采集: 0/{arena.capacity}")
+
+    def show_segments(self):
+        arena = self.segment_arena
+        if arena is None or arena.count == 0:
+            messagebox.showwarning("警告", "无分段数据！")
+            return
+        count = arena.count
+        seg_window = tk.Toplevel(self.root)
+        seg_window.title("分段浏览")
+        seg_window.geometry("1000x600")
+        canvas = tk.Canvas(seg_window, bg='black', highlightthickness=0)
+        canvas.pack(fill=tk.BOTH, expand=True)
+        ctrl = ttk.Frame(seg_window)
+        ctrl.pack(fill=tk.X, padx=5, pady=5)
+        index_var = tk.IntVar(value=count - 1)
+        overlay_var = tk.BooleanVar(value=False)
+        info_var = tk.StringVar()
+        colors = [self.config.get(f'color_ch{i}', ['cyan', 'yellow', 'magenta'][i]) for i in range(3)]
+
+        def trace_points(data, width, height):
+            # 0..5V 映射到画布全高
+            n = data.shape[1]
+            xs = np.arange(n) * (width / max(n - 1, 1))
+            ys = height * (1.0 - data / 5.0)
+            return [np.column_stack((xs, y)).ravel().tolist() for y in ys]
+
+        def redraw(*_):
+            canvas.delete("all")
+            width, height = canvas.winfo_width(), canvas.winfo_height()
+            if width < 10 or height < 10:
+                return
+            index = min(max(index_var.get(), 0), count - 1)
+            if overlay_var.get():
+                # 最多叠加 64 段, 均匀抽取
+                for i in np.linspace(0, count - 1, min(count, 64)).astype(int):
+                    for ch, points in enumerate(trace_points(arena.segment(i), width, height)):
+                        if self.channel_active(ch) and len(points) >= 4:
+                            canvas.create_line(points, fill='gray40')
+            for ch, points in enumerate(trace_points(arena.segment(index), width, height)):
+                if self.channel_active(ch) and len(points) >= 4:
+                    canvas.create_line(points, fill=colors[ch], width=2)
+            seq = arena.seqs[index]
+            info_var.set(f"段 {index + 1}/{count} | 序号: {seq if seq >= 0 else '-'} | "
+                         f"t = {arena.times[index] - arena.times[0]:.6f} s | 存储: {arena.nbytes / 1e6:.1f} MB")
+
+        ttk.Scale(ctrl, from_=0, to=count - 1, variable=index_var, orient=tk.HORIZONTAL,
+                  command=redraw).pack(side=tk.LEFT, fill=tk.X, expand=True)
+        ttk.Checkbutton(ctrl, text="叠加显示", variable=overlay_var, command=redraw).pack(side=tk.LEFT, padx=5)
+        ttk.Label(ctrl, textvariable=info_var).pack(side=tk.LEFT, padx=5)
+        canvas.bind('<Configure>', redraw)
+
     def show_measurements(self):
         self.update_measurements_display()
 
@@ -1048,10 +2938,9 @@ class UltimateOscilloscopeFinal:
             try:
                 with open(filename, 'w') as f:
                     f.write("Time,CH1,CH2,CH3\n")
-                    actual_time_per_div = self.time_base
-                    total_time = actual_time_per_div * 10
-                    for i in range(self.SAMPLES_PER_CHAN):
-                        t = i * (total_time / self.SAMPLES_PER_CHAN)
+                    n = self.current_data.shape[1]
+                    for i in range(n):
+                        t = i * self.sample_interval
                         f.write(f"{t:.9f},{self.current_data[0][i]:.4f},{self.current_data[1][i]:.4f},{self.current_data[2][i]:.4f}\n")
                 messagebox.showinfo("成功", "数据已保存！")
             except Exception as e:
@@ -1059,7 +2948,10 @@ class UltimateOscilloscopeFinal:
 
     def on_closing(self):
         self.save_config()
+        self.stop_event.set()
         self.disconnect_serial()
+        if self.acq_thread:
+            self.acq_thread.join(timeout=1.0)
         self.root.destroy()
 
 # ========== 启动 ==========
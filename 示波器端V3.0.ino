@@ -0,0 +1,828 @@
+/*
+ * 终极示波器固件 - V3 帧协议版 (3电位器 + 10按钮)
+ * - 3通道信号: A0, A1, A2
+ * - 3电位器: A3(扫描范围), A4(扫描微调), A5(Y轴移位)
+ * - 10按钮: D2-D11
+ * - 波特率: 250000
+ * - 样本预算: 由启用的通道平分; ATmega2560 为 600 (3通道x200), ATmega328P 为 300 (3通道x100)
+ * - 采集引擎: Timer1 比较匹配 B 自动触发 ADC, 在 ADC 中断中轮流采样各通道,
+ *   写入双缓冲: 一个缓冲区填充时另一个发送, 采样永不等待串口;
+ *   发送来不及时丢弃刚采满的帧 (计数 acqOverruns), 帧内采样间隔始终均匀
+ * - 边沿触发 (主机命令 0x07): 缓冲区作为环形缓冲连续写入, ISR 在触发源通道上检测
+ *   电平/斜率穿越, 触发后再采满预设的触发后样本即结束本帧; 发送时从最旧样本开始,
+ *   触发点位于记录的 预触发百分比 处。自动模式下 TRIGGER_AUTO_MS 内无触发则强制触发
+ * - 等效时间采样: 触发命令标志位 TRIG_FLAG_DITHER 置位时, 每帧结束后把 Timer1 计数设为
+ *   伪随机值, 使下一帧的采样时刻相对信号随机错开 (即使信号与本板时钟同源);
+ *   主机按上报的触发相位把多帧样本拼成高分辨率合成记录
+ * - 无间隙流模式 (主机命令 0x08): 每行 = 各启用通道一个转换 + 1 个辅助转换 (电位器轮流),
+ *   转换序列严格周期, 各通道采样均匀且帧与帧之间没有空隙; 不使用触发, 帧间不延时,
+ *   缓冲区采满即交给主循环发送, 控制帧降为每 PACED_CTRL_INTERVAL 一帧穿插在波形帧之间。
+ *   每帧携带首样本的行序号, 发送来不及而丢弃的帧在主机端表现为序号跳变
+ * - ADC 模式 (主机命令 0x06 选择):
+ *   ADC_MODE_NORMAL 定时触发, 预分频 128, 10 位, ADC_TICK_HZ
+ *   ADC_MODE_FAST   自由运行, 预分频 32 (500kHz ADC 时钟), 10 位, 约 38.5kS/s
+ *   ADC_MODE_FAST8  自由运行, 预分频 16 (1MHz ADC 时钟), 8 位 (左对齐读 ADCH), 约 76.9kS/s
+ *   自由运行时 Timer1 作为时基: 转换严格每 13 个 ADC 时钟完成一次, ADC 中断晚到一整个转换周期
+ *   (被 Timer0/串口中断耽搁) 说明有一次转换结果被覆盖, 通道顺序从此错位; 此时丢弃本帧、
+ *   计入 acqOverruns, 由主循环重新启动采集使通道重新对齐
+ *   以上为所有启用通道合计的转换率; 8 位样本左移 2 位, 主机仍按 10 位刻度解码
+ * - 帧格式: 5A A5 | 版本 | 类型 | 序号(u16) | 长度(u16) | 负载 | CRC16
+ *   CRC16 为 CRC-16/CCITT-FALSE (多项式 0x1021, 初值 0xFFFF), 覆盖 版本..负载
+ *   所有多字节字段均为小端
+ * - 波形帧负载 = 首样本 micros(u32) | 末样本 micros(u32) | 触发行(u16) | 触发相位(u16) |
+ *   首样本行序号(u32) | 编码后的样本;
+ *   两个时间戳在 ADC 中断中记录, 主机据此计算实际采样间隔;
+ *   行序号仅流模式有效 (自开始采集起每通道的样本序号, 回绕), 其他模式为 0xFFFFFFFF;
+ *   电平穿越发生在第 触发行-1 与 触发行 个样本之间, 相位为线性插值的小数位置 (1/65536 样本);
+ *   未触发 (连续采集或自动模式强制触发) 时触发行为 0xFFFF
+ * - 波形编码 (WAVE_ENCODING):
+ *   ENC_RAW16    每样本 2 字节 (类型 0x01)
+ *   ENC_PACKED10 4 样本/5 字节 (类型 0x03)
+ *   ENC_DELTA    同通道差分 (类型 0x04), 负载 = 2位类别表 | 4位差分流 | 8位差分流 | 16位差分流
+ *                类别 0/1/2 对应 4/8/16 位有符号差分, 每通道首样本相对 0 计算;
+ *                压缩后不小于紧凑编码时自动改发紧凑帧
+ * - 配置帧 (类型 0x05): 每通道样本数(u16) | 通道掩码(u8) | ADC模式(u8) | 每通道采样率Hz(u32) |
+ *   标志(u8, bit0=流模式) | 采集溢出帧数(u16, 自上电累计, 回绕),
+ *   上电、每 INFO_INTERVAL 帧及每条命令后发送
+ * - 信用流控 (主机命令 0x09): 主机按已收到的帧序号授予 "帧序号上限", 设备只在下一帧序号
+ *   小于上限时发送波形帧, 不再插入固定帧间隔; 主机处理得越快上限推进得越快, 链路跑满而
+ *   在途数据始终不超过主机的信用窗口。额度用尽时刚采满的帧留待发送 (期间 ISR 丢弃新帧),
+ *   控制帧照常低频发送, 其序号让主机在丢帧后也能继续推进上限。未收到授权前沿用帧间隔
+ * - 主机命令: A5 5A | 命令 | 长度 | 负载 | CRC16 (同上, 覆盖 命令..负载)
+ *   0x01 通道掩码(u8)  0x02 每通道样本数(u16, 0=平分预算)  0x03 帧间隔ms(u16)
+ *   0x04 运行/停止(u8)  0x05 波形编码(u8)  0x06 ADC模式(u8)
+ *   0x07 触发: 模式(u8 0=关 1=常规 2=自动) | 源通道(u8) | 斜率(u8 0=上升 1=下降) |
+ *        电平(u16 ADC 计数) | 预触发百分比(u8) [| 标志(u8) bit0=等效时间采样抖动]
+ *   0x08 流模式(u8 0=关 1=开)
+ *   0x09 信用授权: 帧序号上限(u16); 空负载 = 关闭信用流控, 恢复帧间隔 (此命令不回送配置帧)
+ *   停止时不再发送波形帧, 控制帧降为约 10 帧/秒
+ */
+
+#define MAX_CHANNELS 3
+// 所有启用通道共享的样本预算, 须为 4 的倍数; 双缓冲共占 4*TOTAL_SAMPLES 字节 RAM
+#if defined(__AVR_ATmega2560__)
+#define TOTAL_SAMPLES 600
+#else
+#define TOTAL_SAMPLES 300
+#endif
+#define ADC_TICK_HZ 9000UL  // ADC 触发频率 (各通道轮流), 默认预分频 128 时上限约 9.6kHz
+#define POT_SLOTS 3         // 每帧之间插入的电位器转换 (A3..A5)
+#define BAUD_RATE 250000
+#define CHANNEL_MASK 0x07  // bit0..2 对应 A0..A2
+#define INFO_INTERVAL 50
+
+#define FRAME_VERSION 3
+#define FRAME_TYPE_WAVE 0x01
+#define FRAME_TYPE_CTRL 0x02
+#define FRAME_TYPE_WAVE_PACKED 0x03
+#define FRAME_TYPE_WAVE_DELTA 0x04
+#define FRAME_TYPE_INFO 0x05
+#define CTRL_PAYLOAD_SIZE 16
+#define INFO_PAYLOAD_SIZE 11
+#define WAVE_STAMP_SIZE 16  // 波形帧负载前的首/末样本时间戳、触发位置与行序号
+#define INFO_FLAG_STREAM 0x01
+
+#define CMD_SET_CHANNEL_MASK 0x01
+#define CMD_SET_RECORD_LENGTH 0x02
+#define CMD_SET_FRAME_DELAY 0x03
+#define CMD_RUN_STOP 0x04
+#define CMD_SET_ENCODING 0x05
+#define CMD_SET_ADC_MODE 0x06
+#define CMD_SET_TRIGGER 0x07
+#define CMD_SET_STREAM 0x08
+#define CMD_SET_CREDITS 0x09
+#define CMD_MAX_PAYLOAD 8
+#define STOPPED_CTRL_INTERVAL 100  // 停止采集时控制帧间隔 (ms)
+#define PACED_CTRL_INTERVAL 100    // 流模式/信用流控下控制帧间隔 (ms)
+#define STREAM_ROW_NONE 0xFFFFFFFFUL
+
+#define ENC_RAW16 0
+#define ENC_PACKED10 1  // 10位紧凑编码, 链路利用率提升约1.6倍
+#define ENC_DELTA 2     // 差分编码, 适合缓变信号
+#define WAVE_ENCODING ENC_PACKED10
+
+#define ADC_MODE_NORMAL 0
+#define ADC_MODE_FAST 1
+#define ADC_MODE_FAST8 2
+
+#define TRIG_OFF 0
+#define TRIG_NORMAL 1
+#define TRIG_AUTO 2
+#define TRIGGER_AUTO_MS 100  // 自动触发模式的等待上限
+#define TRIG_FLAG_DITHER 0x01
+#define TRIG_ROW_NONE 0xFFFF
+
+uint8_t waveEncoding = WAVE_ENCODING;
+uint8_t adcMode = ADC_MODE_NORMAL;
+uint8_t channelMask = CHANNEL_MASK;
+uint8_t activeInputs[MAX_CHANNELS];  // 启用通道的 ADC 输入号 (A0..A2 -> 0..2)
+uint8_t activeCount = 0;
+uint16_t requestedLength = 0;     // 主机请求的每通道样本数, 0 = 平分预算
+uint16_t recordLength = 0;        // 每通道样本数
+uint16_t sampleCount = 0;         // recordLength * activeCount
+uint16_t framesSinceInfo = 0;
+
+uint8_t trigMode = TRIG_OFF;
+uint8_t trigSource = 0;           // 触发源 (A0..A2)
+uint8_t trigFalling = 0;
+uint16_t trigLevel = 512;         // ADC 计数
+uint8_t trigPrePercent = 50;      // 触发点在记录中的位置
+uint8_t trigFlags = 0;
+uint8_t streaming = 0;            // 无间隙流模式
+
+// 双缓冲, 交织存放: samples[buf][i*activeCount + k]
+volatile uint16_t samples[2][TOTAL_SAMPLES];
+volatile uint8_t fillBuf = 0;       // ISR 正在填充的缓冲区
+volatile int8_t readyBuf = -1;      // 已采满待发送的缓冲区, -1 表示空闲
+// 转换序列: 信号转换 (通道轮流) 环形写入缓冲区, 记录结束后插入 POT_SLOTS 个电位器转换
+// 无触发时记录为 sampleCount 个转换; 有触发时为触发后再采 trigPost 个转换
+#define SIG_UNBOUNDED 0xFFFF        // 尚未触发, 剩余信号转换数不定
+volatile uint8_t inPots = 0;        // 刚完成的转换属于电位器段
+volatile uint8_t potPos = 0;
+volatile uint16_t wpos = 0;         // 环形写位置
+volatile uint8_t dataK = 0;         // wpos 对应的启用通道序号
+volatile uint32_t runCount = 0;     // 本帧已完成的信号转换数
+volatile uint16_t sigRemain;        // 本帧结束前剩余的信号转换数
+volatile uint16_t trigPrev;
+volatile uint8_t forceTrigger = 0;
+// ADMUX 光标: 已写入 ADMUX 的转换, 自由运行时比刚完成的转换超前一次
+volatile uint8_t muxInPots = 0;
+volatile uint8_t muxPot = 0;
+volatile uint8_t muxK = 0;
+volatile uint16_t muxRemain;
+uint8_t muxLead = 0;
+// 自由运行的漏转换检测 (Timer1 计数, 预分频 8)
+uint16_t convTicks = 0;             // 一次转换的 Timer1 计数
+uint16_t convDue = 0;               // 本次中断对应转换的预期完成时刻
+uint8_t convSynced = 0;
+volatile uint8_t adcResync = 0;     // 检测到漏转换, 等待主循环重启采集
+// 由 applyTrigger() 按当前记录布局换算
+uint8_t trigK = 0;                  // 触发源在启用通道中的序号
+uint16_t trigPost = 0;              // 触发后的信号转换数
+uint32_t trigArmAt = 0;             // 预触发样本采满所需的转换数
+uint16_t trigRow = 0;               // 触发样本所在的行
+volatile uint8_t ditherPhase = 0;   // 帧间随机错开 Timer1 相位 (仅定时触发模式)
+volatile uint16_t ditherSeed = 0xACE1;
+volatile uint8_t adcEightBit = 0;
+uint8_t admuxBase = _BV(REFS0);     // AVcc 参考
+volatile uint16_t potValues[POT_SLOTS];
+volatile uint16_t acqOverruns = 0;
+volatile uint32_t bufStartUs[2];    // 各缓冲区首/末信号转换的 micros()
+volatile uint32_t bufEndUs[2];
+volatile uint32_t bufRunCount[2];   // 两个时间戳之间的信号转换数
+volatile uint16_t bufOldest[2];     // 最旧样本在环形缓冲中的位置
+volatile uint16_t bufTrigPrev[2];   // 触发穿越前后的两个样本, 强制触发时 bufForced 置位
+volatile uint16_t bufTrigVal[2];
+volatile uint8_t bufForced[2];
+volatile uint32_t streamRow = 0;    // 流模式: 当前行序号
+volatile uint32_t bufFirstRow[2];   // 流模式: 各缓冲区首样本的行序号
+const uint16_t *txSamples;          // 正在发送的缓冲区
+uint16_t txOffset;                  // 其最旧样本的位置
+uint32_t txStartUs, txEndUs;
+uint16_t txTrigRow, txTrigPhase;
+uint32_t txFirstRow = STREAM_ROW_NONE;
+unsigned long lastRecordMs = 0;
+unsigned long lastCtrlMs = 0;
+uint16_t frameDelayMs = 10;
+uint8_t creditMode = 0;             // 已收到主机授权, 按信用发送
+uint16_t creditLimit = 0;           // 可发送的帧序号上限 (不含)
+bool acquiring = true;
+
+// 命令解析状态机
+uint8_t cmdState = 0;
+uint8_t cmdId, cmdLen, cmdPos, cmdCrcLow;
+uint8_t cmdBuf[CMD_MAX_PAYLOAD];
+uint16_t cmdCrc;
+
+uint16_t frameSeq = 0;
+uint16_t frameCrc = 0xFFFF;
+
+uint16_t crc16Update(uint16_t crc, uint8_t b) {
+  crc ^= (uint16_t)b << 8;
+  for (uint8_t i = 0; i < 8; i++) {
+    crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : (crc << 1);
+  }
+  return crc;
+}
+
+// 发送一个字节并计入当前帧的 CRC
+void sendByte(uint8_t b) {
+  Serial.write(b);
+  frameCrc = crc16Update(frameCrc, b);
+}
+
+void sendWord(uint16_t v) {
+  sendByte(lowByte(v));
+  sendByte(highByte(v));
+}
+
+void sendDword(uint32_t v) {
+  sendWord(v & 0xFFFF);
+  sendWord(v >> 16);
+}
+
+void beginFrame(uint8_t type, uint16_t length) {
+  Serial.write(0x5A);
+  Serial.write(0xA5);
+  frameCrc = 0xFFFF;
+  sendByte(FRAME_VERSION);
+  sendByte(type);
+  sendWord(frameSeq++);
+  sendWord(length);
+}
+
+void endFrame() {
+  uint16_t crc = frameCrc;
+  Serial.write(lowByte(crc));
+  Serial.write(highByte(crc));
+}
+
+// 波形帧: 帧头后紧跟首/末样本时间戳, length 为编码后样本的字节数
+void beginWaveFrame(uint8_t type, uint16_t length) {
+  beginFrame(type, WAVE_STAMP_SIZE + length);
+  sendDword(txStartUs);
+  sendDword(txEndUs);
+  sendWord(txTrigRow);
+  sendWord(txTrigPhase);
+  sendDword(txFirstRow);
+}
+
+// 按时间顺序取第 i 个待发送样本
+static inline uint16_t txSample(uint16_t i) {
+  uint16_t j = i + txOffset;
+  if (j >= sampleCount) j -= sampleCount;
+  return txSamples[j];
+}
+
+void sendRaw16Frame() {
+  beginWaveFrame(FRAME_TYPE_WAVE, sampleCount * 2);
+  for (uint16_t i = 0; i < sampleCount; i++) {
+    sendWord(txSample(i));
+  }
+  endFrame();
+}
+
+// 4 个低字节 + 1 字节存放 4 个高 2 位
+void sendPacked10Frame() {
+  beginWaveFrame(FRAME_TYPE_WAVE_PACKED, sampleCount / 4 * 5);
+  for (uint16_t i = 0; i < sampleCount; i += 4) {
+    uint8_t high = 0;
+    for (uint8_t k = 0; k < 4; k++) {
+      uint16_t v = txSample(i + k);
+      sendByte(lowByte(v));
+      high |= (highByte(v) & 0x03) << (2 * k);
+    }
+    sendByte(high);
+  }
+  endFrame();
+}
+
+int16_t sampleDelta(uint16_t i) {
+  return (int16_t)txSample(i) - (i >= activeCount ? (int16_t)txSample(i - activeCount) : 0);
+}
+
+uint8_t deltaClass(int16_t d) {
+  if (d >= -8 && d <= 7) return 0;
+  if (d >= -128 && d <= 127) return 1;
+  return 2;
+}
+
+void sendDeltaFrame() {
+  uint16_t n4 = 0, n8 = 0, n16 = 0;
+  for (uint16_t i = 0; i < sampleCount; i++) {
+    uint8_t c = deltaClass(sampleDelta(i));
+    if (c == 0) n4++;
+    else if (c == 1) n8++;
+    else n16++;
+  }
+  uint16_t length = sampleCount / 4 + (n4 + 1) / 2 + n8 + 2 * n16;
+  if (length >= sampleCount / 4 * 5) {
+    sendPacked10Frame();
+    return;
+  }
+  beginWaveFrame(FRAME_TYPE_WAVE_DELTA, length);
+  // 类别表: 每字节 4 个样本, 低位在前
+  for (uint16_t i = 0; i < sampleCount; i += 4) {
+    uint8_t map = 0;
+    for (uint8_t k = 0; k < 4; k++) {
+      map |= deltaClass(sampleDelta(i + k)) << (2 * k);
+    }
+    sendByte(map);
+  }
+  // 4 位差分流: 每字节 2 个, 低半字节在前
+  uint8_t nibble = 0;
+  bool half = false;
+  for (uint16_t i = 0; i < sampleCount; i++) {
+    int16_t d = sampleDelta(i);
+    if (deltaClass(d) != 0) continue;
+    if (!half) {
+      nibble = d & 0x0F;
+    } else {
+      sendByte(nibble | ((d & 0x0F) << 4));
+    }
+    half = !half;
+  }
+  if (half) sendByte(nibble);
+  for (uint16_t i = 0; i < sampleCount; i++) {
+    int16_t d = sampleDelta(i);
+    if (deltaClass(d) == 1) sendByte((uint8_t)d);
+  }
+  for (uint16_t i = 0; i < sampleCount; i++) {
+    int16_t d = sampleDelta(i);
+    if (deltaClass(d) == 2) sendWord((uint16_t)d);
+  }
+  endFrame();
+}
+
+void sendWaveFrame() {
+  if (waveEncoding == ENC_DELTA) {
+    sendDeltaFrame();
+  } else if (waveEncoding == ENC_PACKED10) {
+    sendPacked10Frame();
+  } else {
+    sendRaw16Frame();
+  }
+}
+
+// 按通道掩码重新分配样本预算
+void applyChannelMask(uint8_t mask) {
+  channelMask = mask & ((1 << MAX_CHANNELS) - 1);
+  if (channelMask == 0) channelMask = 0x01;
+  activeCount = 0;
+  for (uint8_t ch = 0; ch < MAX_CHANNELS; ch++) {
+    if (channelMask & (1 << ch)) activeInputs[activeCount++] = ch;
+  }
+  uint16_t maxLength = TOTAL_SAMPLES / activeCount;
+  recordLength = (requestedLength && requestedLength < maxLength) ? requestedLength : maxLength;
+  recordLength = max(recordLength & ~3, 4);  // 总样本数保持 4 的倍数 (紧凑/差分编码)
+  sampleCount = recordLength * activeCount;
+}
+
+// 所有启用通道合计的转换率
+uint32_t conversionRateHz() {
+  switch (adcMode) {
+    case ADC_MODE_FAST: return F_CPU / 32 / 13;
+    case ADC_MODE_FAST8: return F_CPU / 16 / 13;
+    default: return ADC_TICK_HZ;
+  }
+}
+
+uint8_t adcPrescalerBits() {
+  switch (adcMode) {
+    case ADC_MODE_FAST: return _BV(ADPS2) | _BV(ADPS0);              // 32
+    case ADC_MODE_FAST8: return _BV(ADPS2);                          // 16
+    default: return _BV(ADPS2) | _BV(ADPS1) | _BV(ADPS0);            // 128
+  }
+}
+
+// 按触发设置与当前记录布局计算触发点; 记录从通道 0 开始, 触发样本位于第 pre 行
+void applyTrigger() {
+  trigK = 0;
+  for (uint8_t k = 0; k < activeCount; k++) {
+    if (activeInputs[k] == trigSource) trigK = k;
+  }
+  uint16_t pre = (uint32_t)recordLength * trigPrePercent / 100;
+  if (pre > recordLength - 3) pre = recordLength - 3;  // 触发后至少 3 行, ADMUX 光标才有余量
+  trigRow = pre;
+  trigPost = (recordLength - pre) * activeCount - 1 - trigK;
+  trigArmAt = (uint32_t)max(pre, 1) * activeCount + trigK + 1;  // 同时保证 trigPrev 有效
+}
+
+// 新一帧首个信号转换 (含) 起剩余的信号转换数; 无触发时首个转换即视为触发点
+static inline uint16_t recordStartRemain() {
+  return trigMode == TRIG_OFF ? sampleCount : SIG_UNBOUNDED;
+}
+
+// ADMUX 光标的计数不含其当前所指的转换
+static inline uint16_t muxStartRemain() {
+  return trigMode == TRIG_OFF ? sampleCount - 1 : SIG_UNBOUNDED;
+}
+
+// 把 ADMUX 光标推进到下一个转换
+static inline void advanceMux() {
+  if (muxInPots) {
+    if (++muxPot < POT_SLOTS) {
+      ADMUX = admuxBase | (3 + muxPot);
+      return;
+    }
+    muxInPots = 0;
+    muxK = 0;
+    muxRemain = muxStartRemain();
+  } else if (muxRemain == 0) {
+    muxInPots = 1;
+    muxPot = 0;
+    ADMUX = admuxBase | 3;
+    return;
+  } else {
+    if (muxRemain != SIG_UNBOUNDED) muxRemain--;
+    if (++muxK >= activeCount) muxK = 0;
+  }
+  ADMUX = admuxBase | activeInputs[muxK];
+}
+
+// 流模式: 每行 activeCount 个信号转换后接 1 个电位器转换, muxK == activeCount 表示辅助转换
+static inline void advanceStreamMux() {
+  if (++muxK > activeCount) muxK = 0;
+  if (muxK < activeCount) {
+    ADMUX = admuxBase | activeInputs[muxK];
+  } else {
+    ADMUX = admuxBase | (3 + muxPot);
+    if (++muxPot >= POT_SLOTS) muxPot = 0;
+  }
+}
+
+// 流模式的转换处理: 线性写满缓冲区后立即换到另一个, 序列中没有额外的空隙
+static inline void streamConversion(uint16_t v) {
+  if (dataK == activeCount) {
+    potValues[potPos] = v;
+    if (++potPos >= POT_SLOTS) potPos = 0;
+    dataK = 0;
+    streamRow++;
+    return;
+  }
+  uint16_t w = wpos;
+  if (w == 0) {
+    bufStartUs[fillBuf] = micros();
+    bufFirstRow[fillBuf] = streamRow;
+  }
+  samples[fillBuf][w] = v;
+  if (++w >= sampleCount) {
+    bufEndUs[fillBuf] = micros();
+    bufRunCount[fillBuf] = sampleCount;
+    bufOldest[fillBuf] = 0;
+    if (readyBuf < 0) {
+      readyBuf = fillBuf;
+      fillBuf ^= 1;
+    } else {
+      acqOverruns++;  // 来不及发送, 本帧的行在主机端表现为序号跳变
+    }
+    w = 0;
+  }
+  wpos = w;
+  dataK++;
+}
+
+// ADC 转换完成: 保存结果, 检测触发, 并为后续转换选择输入
+ISR(ADC_vect) {
+  uint16_t v = adcEightBit ? (uint16_t)ADCH << 2 : ADC;
+  TIFR1 = _BV(OCF1B);  // 清除比较匹配标志, 下一次匹配才能再次触发 ADC
+  if (muxLead) {
+    // 首次中断校准完成时刻, 之后每次转换预期晚 convTicks; 晚到一整个周期即下一次转换也已完成
+    uint16_t now = TCNT1;
+    if (!convSynced) {
+      convDue = now;
+      convSynced = 1;
+    }
+    if ((uint16_t)(now - convDue) >= convTicks) {
+      ADCSRA &= ~_BV(ADIE);
+      adcResync = 1;
+      acqOverruns++;
+      return;
+    }
+    convDue += convTicks;
+  }
+  if (streaming) {
+    streamConversion(v);
+    advanceStreamMux();
+    return;
+  }
+  if (inPots) {
+    potValues[potPos] = v;
+    if (++potPos >= POT_SLOTS) {
+      inPots = 0;
+      wpos = 0;
+      dataK = 0;
+      runCount = 0;
+      sigRemain = recordStartRemain();
+    }
+  } else {
+    uint16_t w = wpos;
+    samples[fillBuf][w] = v;
+    if (runCount == 0) bufStartUs[fillBuf] = micros();
+    runCount++;
+    if (sigRemain == SIG_UNBOUNDED) {
+      if (dataK == trigK) {
+        bool crossed = trigFalling ? (trigPrev > trigLevel && v <= trigLevel)
+                                   : (trigPrev < trigLevel && v >= trigLevel);
+        if (runCount >= trigArmAt && (crossed || forceTrigger)) {
+          sigRemain = trigPost;
+          muxRemain = trigPost - muxLead;
+          bufTrigPrev[fillBuf] = trigPrev;
+          bufTrigVal[fillBuf] = v;
+          bufForced[fillBuf] = !crossed;
+        }
+        trigPrev = v;
+      }
+    } else if (--sigRemain == 0) {
+      bufEndUs[fillBuf] = micros();
+      bufRunCount[fillBuf] = runCount;
+      bufOldest[fillBuf] = w + 1 >= sampleCount ? 0 : w + 1;
+      if (readyBuf < 0) {
+        readyBuf = fillBuf;
+        fillBuf ^= 1;
+      } else {
+        acqOverruns++;  // 上一帧仍在发送, 丢弃本帧并原地重新填充
+      }
+      inPots = 1;
+      potPos = 0;
+      forceTrigger = 0;
+      if (ditherPhase) {
+        // xorshift16, 新相位落在 [0, OCR1A) 内才不会错过比较匹配
+        uint16_t x = ditherSeed;
+        x ^= x << 7;
+        x ^= x >> 9;
+        x ^= x << 8;
+        ditherSeed = x;
+        TCNT1 = x % OCR1A;
+      }
+    }
+    if (++w >= sampleCount) w = 0;
+    wpos = w;
+    if (++dataK >= activeCount) dataK = 0;
+  }
+  advanceMux();
+}
+
+void startSampling() {
+  cli();
+  fillBuf = 0;
+  readyBuf = -1;
+  applyTrigger();
+  inPots = 0;
+  wpos = 0;
+  dataK = 0;
+  runCount = 0;
+  forceTrigger = 0;
+  sigRemain = recordStartRemain();
+  muxInPots = 0;
+  muxK = 0;
+  muxPot = 0;
+  muxRemain = muxStartRemain();
+  muxLead = adcMode != ADC_MODE_NORMAL;
+  ditherPhase = !streaming && !muxLead && trigMode != TRIG_OFF && (trigFlags & TRIG_FLAG_DITHER);
+  potPos = 0;
+  streamRow = 0;
+  adcResync = 0;
+  lastRecordMs = millis();
+  adcEightBit = adcMode == ADC_MODE_FAST8;
+  admuxBase = _BV(REFS0) | (adcEightBit ? _BV(ADLAR) : 0);
+  ADMUX = admuxBase | activeInputs[0];
+  if (adcMode == ADC_MODE_NORMAL) {
+    ADCSRB = _BV(ADTS2) | _BV(ADTS0);                                   // 触发源: Timer1 比较匹配 B
+    ADCSRA = _BV(ADEN) | _BV(ADATE) | _BV(ADIE) | adcPrescalerBits();
+    TCCR1A = 0;
+    TCCR1B = _BV(WGM12) | _BV(CS11);                                    // CTC, 预分频 8
+    OCR1A = F_CPU / 8 / ADC_TICK_HZ - 1;
+    OCR1B = OCR1A;
+    TCNT1 = 0;
+    TIFR1 = _BV(OCF1B);
+  } else {
+    TCCR1A = 0;
+    TCCR1B = _BV(CS11);                                                 // 普通模式, 预分频 8, 仅作时基
+    TCNT1 = 0;
+    convTicks = (adcMode == ADC_MODE_FAST8 ? 16 : 32) * 13 / 8;
+    convSynced = 0;
+    ADCSRB = 0;                                                         // 自由运行
+    ADCSRA = _BV(ADEN) | _BV(ADATE) | _BV(ADIE) | _BV(ADSC) | adcPrescalerBits();
+    // 首次转换已按 MUX(0) 启动; 自由运行时新的 ADMUX 要到下下次转换才生效
+    delayMicroseconds(4);
+    if (streaming) advanceStreamMux();
+    else advanceMux();
+  }
+  sei();
+}
+
+void stopSampling() {
+  TCCR1B = 0;
+  // 停止自动转换, 恢复预分频 128 供 analogRead 使用
+  ADCSRA = (ADCSRA & ~(_BV(ADATE) | _BV(ADIE))) | _BV(ADPS2) | _BV(ADPS1) | _BV(ADPS0);
+  readyBuf = -1;
+}
+
+uint16_t readPot(uint8_t k) {
+  if (!acquiring) return analogRead(A3 + k);
+  uint8_t oldSREG = SREG;
+  cli();
+  uint16_t v = potValues[k];
+  SREG = oldSREG;
+  return v;
+}
+
+void sendInfoFrame() {
+  // 流模式每行多一个辅助转换
+  uint32_t rate = conversionRateHz() / (activeCount + streaming);
+  beginFrame(FRAME_TYPE_INFO, INFO_PAYLOAD_SIZE);
+  sendWord(recordLength);
+  sendByte(channelMask);
+  sendByte(adcMode);
+  sendDword(rate);
+  sendByte(streaming ? INFO_FLAG_STREAM : 0);
+  uint8_t oldSREG = SREG;
+  cli();
+  uint16_t overruns = acqOverruns;
+  SREG = oldSREG;
+  sendWord(overruns);
+  endFrame();
+  framesSinceInfo = 0;
+}
+
+// 信用流控下, 下一帧序号须小于主机授予的上限 (按 16 位回绕比较)
+bool creditAvailable() {
+  return !creditMode || (int16_t)(creditLimit - frameSeq) > 0;
+}
+
+void handleCommand() {
+  switch (cmdId) {
+    case CMD_SET_CHANNEL_MASK:
+      if (cmdLen >= 1) {
+        stopSampling();
+        applyChannelMask(cmdBuf[0]);
+        if (acquiring) startSampling();
+      }
+      break;
+    case CMD_SET_RECORD_LENGTH:
+      if (cmdLen >= 2) {
+        stopSampling();
+        requestedLength = cmdBuf[0] | (cmdBuf[1] << 8);
+        applyChannelMask(channelMask);
+        if (acquiring) startSampling();
+      }
+      break;
+    case CMD_SET_FRAME_DELAY:
+      if (cmdLen >= 2) frameDelayMs = cmdBuf[0] | (cmdBuf[1] << 8);
+      break;
+    case CMD_RUN_STOP:
+      if (cmdLen >= 1) {
+        acquiring = cmdBuf[0] != 0;
+        stopSampling();
+        if (acquiring) startSampling();
+      }
+      break;
+    case CMD_SET_ENCODING:
+      if (cmdLen >= 1 && cmdBuf[0] <= ENC_DELTA) waveEncoding = cmdBuf[0];
+      break;
+    case CMD_SET_TRIGGER:
+      if (cmdLen >= 6 && cmdBuf[0] <= TRIG_AUTO) {
+        stopSampling();
+        trigMode = cmdBuf[0];
+        trigSource = cmdBuf[1] < MAX_CHANNELS ? cmdBuf[1] : 0;
+        trigFalling = cmdBuf[2] != 0;
+        trigLevel = cmdBuf[3] | (cmdBuf[4] << 8);
+        trigPrePercent = min(cmdBuf[5], 100);
+        trigFlags = cmdLen >= 7 ? cmdBuf[6] : 0;
+        if (acquiring) startSampling();
+      }
+      break;
+    case CMD_SET_ADC_MODE:
+      if (cmdLen >= 1 && cmdBuf[0] <= ADC_MODE_FAST8) {
+        stopSampling();
+        adcMode = cmdBuf[0];
+        if (acquiring) startSampling();
+      }
+      break;
+    case CMD_SET_CREDITS:
+      // 授权频繁, 不回送配置帧
+      creditMode = cmdLen >= 2;
+      if (creditMode) creditLimit = cmdBuf[0] | (cmdBuf[1] << 8);
+      return;
+    case CMD_SET_STREAM:
+      if (cmdLen >= 1) {
+        stopSampling();
+        streaming = cmdBuf[0] != 0;
+        if (acquiring) startSampling();
+      }
+      break;
+    default:
+      return;
+  }
+  sendInfoFrame();
+}
+
+// 非阻塞地处理串口收到的主机命令
+void pollCommands() {
+  while (Serial.available()) {
+    uint8_t b = Serial.read();
+    switch (cmdState) {
+      case 0:
+        cmdState = (b == 0xA5) ? 1 : 0;
+        break;
+      case 1:
+        cmdState = (b == 0x5A) ? 2 : (b == 0xA5 ? 1 : 0);
+        break;
+      case 2:
+        cmdId = b;
+        cmdCrc = crc16Update(0xFFFF, b);
+        cmdState = 3;
+        break;
+      case 3:
+        cmdLen = b;
+        cmdCrc = crc16Update(cmdCrc, b);
+        cmdPos = 0;
+        cmdState = (cmdLen > CMD_MAX_PAYLOAD) ? 0 : (cmdLen ? 4 : 5);
+        break;
+      case 4:
+        cmdBuf[cmdPos++] = b;
+        cmdCrc = crc16Update(cmdCrc, b);
+        if (cmdPos == cmdLen) cmdState = 5;
+        break;
+      case 5:
+        cmdCrcLow = b;
+        cmdState = 6;
+        break;
+      case 6:
+        if ((((uint16_t)b << 8) | cmdCrcLow) == cmdCrc) handleCommand();
+        cmdState = 0;
+        break;
+    }
+  }
+}
+
+void sendControlFrame() {
+  lastCtrlMs = millis();
+  beginFrame(FRAME_TYPE_CTRL, CTRL_PAYLOAD_SIZE);
+
+  // 3个电位器 (A3, A4, A5)
+  sendWord(readPot(0));  // A3: 扫描范围
+  sendWord(readPot(1));  // A4: 扫描微调
+  sendWord(readPot(2));  // A5: Y轴移位
+
+  // 10个按钮 (D2-D11)
+  for (int pin = 2; pin <= 11; pin++) {
+    sendByte(digitalRead(pin) == LOW ? 1 : 0);
+  }
+  endFrame();
+}
+
+void setup() {
+  Serial.begin(BAUD_RATE);
+  while (!Serial);
+
+  // 配置10个按钮 (D2-D11) 为输入上拉
+  for (int pin = 2; pin <= 11; pin++) {
+    pinMode(pin, INPUT_PULLUP);
+  }
+
+  applyChannelMask(CHANNEL_MASK);
+  sendInfoFrame();
+  startSampling();
+}
+
+void loop() {
+  pollCommands();
+
+  if (acquiring) {
+    if (adcResync) {
+      // 自由运行漏了一次转换, 通道已错位: 重新启动使序列从通道 0 对齐
+      stopSampling();
+      startSampling();
+    }
+    // 等待 ISR 采满一个缓冲区 (及主机授权); 发送期间 ISR 继续填充另一个
+    if (readyBuf < 0 || !creditAvailable()) {
+      // 等待触发/授权时控制帧照常发送, 自动模式超时则强制触发
+      if (!streaming && trigMode == TRIG_AUTO && millis() - lastRecordMs >= TRIGGER_AUTO_MS) forceTrigger = 1;
+      if (millis() - lastCtrlMs >= (streaming ? PACED_CTRL_INTERVAL : STOPPED_CTRL_INTERVAL)) sendControlFrame();
+      return;
+    }
+    uint8_t b = readyBuf;
+    txSamples = (const uint16_t *)samples[b];
+    txOffset = bufOldest[b];
+    txEndUs = bufEndUs[b];
+    txStartUs = bufStartUs[b];
+    // 等待触发期间采集的转换多于一帧时, 按转换数插值出最旧样本的时间
+    uint32_t runs = bufRunCount[b];
+    if (runs > sampleCount) {
+      txStartUs = txEndUs - (uint32_t)((float)(txEndUs - txStartUs) * (sampleCount - 1) / (runs - 1));
+    }
+    txTrigRow = TRIG_ROW_NONE;
+    txTrigPhase = 0;
+    txFirstRow = streaming ? bufFirstRow[b] : STREAM_ROW_NONE;
+    if (!streaming && trigMode != TRIG_OFF && !bufForced[b]) {
+      // 在穿越前后两个样本间线性插值触发电平的位置
+      int32_t num = (int32_t)trigLevel - bufTrigPrev[b];
+      int32_t den = (int32_t)bufTrigVal[b] - bufTrigPrev[b];
+      txTrigRow = trigRow;
+      txTrigPhase = den ? (uint16_t)min(num * 65535L / den, 65535L) : 0;
+    }
+    sendWaveFrame();
+    readyBuf = -1;
+    lastRecordMs = millis();
+    if (++framesSinceInfo >= INFO_INTERVAL) {
+      sendInfoFrame();
+    }
+    if (streaming || creditMode) {
+      // 流模式/信用流控不插入帧间隔, 控制帧按低频率穿插
+      if (millis() - lastCtrlMs >= PACED_CTRL_INTERVAL) sendControlFrame();
+      return;
+    }
+  }
+
+  // 发送控制数据帧
+  sendControlFrame();
+
+  // 帧间隔内继续处理主机命令
+  unsigned long start = millis();
+  uint16_t wait = acquiring ? frameDelayMs : STOPPED_CTRL_INTERVAL;
+  while (millis() - start < wait) {
+    pollCommands();
+  }
+}